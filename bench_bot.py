@@ -0,0 +1,365 @@
+"""Offline benchmark for the broadcast and moderation paths.
+
+Swaps `context.bot` for an in-process FakeBot (configurable latency, error
+rate and RetryAfter injection) and drives the real handlers from
+broadcast_bot.py — no network, no Telegram token needed.
+
+    python bench_bot.py                      # 29, 1000, 10000 groups, no rate limit
+    python bench_bot.py --sizes 29,1000 --latency 0.05 --retry-after-rate 0.01
+    python bench_bot.py --realistic          # keep the real GLOBAL_RATE / GROUP_RATE_PER_MIN
+
+Without --realistic the limiter is opened up, so the numbers show the cost
+of the send loops themselves rather than Telegram's flood limits.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import time
+import tracemalloc
+from collections import Counter
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter, TimedOut
+
+import broadcast_bot as bb
+
+ADMIN_ID = 1
+SPAMMER_ID = 666
+SOURCE_CHAT = 1
+REAL_RATES = (bb.GLOBAL_RATE, bb.GROUP_RATE_PER_MIN)
+CONTENT_RULES = {
+    "words": [f"promo code {i}" for i in range(1000)] + ["free crypto"],
+    "links": ["spam.example"],
+    "channels": ["spamchannel"],
+}
+CLEAN_TEXT = "hello everyone, the meeting notes from today are pinned above " * 2
+
+
+class FakeBot:
+    """Just enough of telegram.Bot for the handlers, with injected latency and failures."""
+
+    def __init__(self, latency=0.02, jitter=0.005, error_rate=0.0, retry_after_rate=0.0, retry_after=1):
+        self.id = 999
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.injected = Counter()
+        self.next_message_id = 1000
+
+    async def _call(self, name, result=True):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        roll = random.random()
+        if roll < self.retry_after_rate:
+            self.injected["RetryAfter"] += 1
+            raise RetryAfter(self.retry_after)
+        if roll < self.retry_after_rate + self.error_rate:
+            self.injected["TimedOut"] += 1
+            raise TimedOut()
+        return result
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.next_message_id += 1
+        return await self._call("copy_message", SimpleNamespace(message_id=self.next_message_id))
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        return await self._call("pin_chat_message")
+
+    async def unpin_all_chat_messages(self, chat_id, **kwargs):
+        return await self._call("unpin_all_chat_messages")
+
+    async def unpin_chat_message(self, chat_id, message_id=None, **kwargs):
+        return await self._call("unpin_chat_message")
+
+    async def set_chat_title(self, chat_id, title, **kwargs):
+        return await self._call("set_chat_title")
+
+    async def set_chat_description(self, chat_id, description=None, **kwargs):
+        return await self._call("set_chat_description")
+
+    async def set_chat_photo(self, chat_id, photo, **kwargs):
+        return await self._call("set_chat_photo")
+
+    async def get_chat(self, chat_id, **kwargs):
+        chat = SimpleNamespace(id=chat_id, title=f"Group {chat_id}", description="", invite_link=None)
+        return await self._call("get_chat", chat)
+
+    async def get_chat_member_count(self, chat_id, **kwargs):
+        return await self._call("get_chat_member_count", 100)
+
+    async def export_chat_invite_link(self, chat_id, **kwargs):
+        return await self._call("export_chat_invite_link", f"https://t.me/+{abs(chat_id)}")
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return await self._call("edit_message_text", SimpleNamespace(message_id=message_id))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call("send_message", SimpleNamespace(message_id=1))
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        return await self._call("delete_message")
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        return await self._call("delete_messages")
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, **kwargs):
+        return await self._call("restrict_chat_member")
+
+
+class FakeMessage:
+    def __init__(self, bot, chat_id, message_id=1, reply_to=None, **fields):
+        self._bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.reply_to_message = reply_to
+        self.photo = None
+        self.new_chat_title = None
+        self.new_chat_photo = None
+        self.video_chat_started = None
+        self.video_chat_scheduled = None
+        self.from_user = None
+        self.text = None
+        self.caption = None
+        self.entities = ()
+        self.caption_entities = ()
+        self.forward_origin = None
+        self.__dict__.update(fields)
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+    async def delete(self):
+        return await self._bot.delete_message(chat_id=self.chat_id, message_id=self.message_id)
+
+
+class FakeApplication:
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine, update=None, **kwargs):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+def make_context(bot, args=(), job_name=None):
+    return SimpleNamespace(
+        bot=bot,
+        args=list(args),
+        application=FakeApplication(),
+        job=SimpleNamespace(name=job_name) if job_name else None,
+    )
+
+
+def admin_command(bot, reply=True):
+    source = FakeMessage(bot, SOURCE_CHAT, message_id=42) if reply else None
+    message = FakeMessage(bot, SOURCE_CHAT, reply_to=source)
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=ADMIN_ID),
+        effective_chat=SimpleNamespace(id=SOURCE_CHAT),
+        message=message,
+    )
+
+
+def group_message(bot, gid, user_id, **fields):
+    user = SimpleNamespace(id=user_id)
+    message = FakeMessage(bot, gid, from_user=user, **fields)
+    return SimpleNamespace(effective_user=user, effective_chat=SimpleNamespace(id=gid), message=message)
+
+
+async def finish_operations():
+    """Bulk commands return at once and run as tracked operations; wait for them."""
+    while bb.OPERATIONS:
+        await asyncio.gather(*(op.task for op in list(bb.OPERATIONS.values())))
+
+
+# ---------------------------------------------------------------- scenarios
+# Each returns the number of "units" processed (groups or updates).
+
+async def run_broadcast(bot, groups):
+    await bb.broadcast(admin_command(bot), make_context(bot))
+    await finish_operations()
+    return len(groups)
+
+
+async def run_pin(bot, groups):
+    await bb.pin(admin_command(bot), make_context(bot))
+    await finish_operations()
+    return len(groups)
+
+
+async def run_auto_broadcast_job(bot, groups):
+    bb.config["jobs"].setdefault("job_1", bb.new_job_record()).update(
+        time="every 30m", from_chat_id=SOURCE_CHAT, message_id=42, is_active=True, target_group=None
+    )
+    await bb.auto_broadcast_job(SimpleNamespace(bot=bot), "job_1")
+    return len(groups)
+
+
+async def run_setgname(bot, groups):
+    await bb.setgname(admin_command(bot, reply=False), make_context(bot, args=["Bench", "Group"]))
+    await finish_operations()
+    return len(groups)
+
+
+async def run_delete_spammer_message(bot, groups, per_group=5, spam_share=0.1, phrase_share=0.05):
+    """Every group gets `per_group` messages; ~10% come from a blacklisted user
+    and ~5% contain a banned phrase (CONTENT_RULES).
+
+    Updates go through the BLACKLISTED / CONTENT_SPAM pre-filters first, like in the dispatcher.
+    """
+    context = make_context(bot)
+    handled = 0
+    for gid in groups:
+        for i in range(per_group):
+            user_id = SPAMMER_ID if random.random() < spam_share else 10_000 + i
+            text = "join now for FREE CRYPTO signals" if random.random() < phrase_share else CLEAN_TEXT
+            update = group_message(bot, gid, user_id, text=text)
+            if spam_filter(update.message):
+                await bb.delete_spammer_message(update, context)
+            handled += 1
+    return handled
+
+
+async def run_flood(bot, groups, per_group=20, burst_share=0.1):
+    """~10% of groups get a burst of `per_group` messages from one user (muted after
+    FLOOD_LIMIT); the rest see `per_group` messages from distinct users."""
+    context = make_context(bot)
+    handled = 0
+    for gid in groups:
+        burst = random.random() < burst_share
+        for i in range(per_group):
+            update = group_message(bot, gid, 30_000 if burst else 30_000 + i, text=CLEAN_TEXT)
+            if spam_filter(update.message):
+                await bb.delete_spammer_message(update, context)
+            handled += 1
+    return handled
+
+
+def spam_filter(message) -> bool:
+    """The delete_spammer_message handler filter, in dispatcher order."""
+    return bb.FLOODING.filter(message) or bb.BLACKLISTED.filter(message) or bb.CONTENT_SPAM.filter(message)
+
+
+async def run_monitor_changes(bot, groups, per_group=5):
+    """Joins/leaves plus one unauthorized title change per group."""
+    context = make_context(bot)
+    handled = 0
+    for gid in groups:
+        for i in range(per_group):
+            fields = {"new_chat_title": "hacked"} if i == 0 else {}
+            update = group_message(bot, gid, 20_000 + i, **fields)
+            if bb.UNPRIVILEGED.filter(update.message):
+                await bb.monitor_changes(update, context)
+            handled += 1
+    await asyncio.gather(*context.application.tasks)
+    return handled
+
+
+SCENARIOS = {
+    "broadcast": run_broadcast,
+    "pin": run_pin,
+    "auto_broadcast_job": run_auto_broadcast_job,
+    "setgname": run_setgname,
+    "delete_spammer_message": run_delete_spammer_message,
+    "flood": run_flood,
+    "monitor_changes": run_monitor_changes,
+}
+
+
+def prepare(size, args):
+    """Reset module state for a run over `size` fake groups."""
+    groups = [-1_000_000_000_000 - i for i in range(size)]
+    bb.REGISTRY = bb.GroupRegistry(groups)
+    bb.ADMIN_IDS = [ADMIN_ID]
+    bb.config["blacklist"] = [SPAMMER_ID]
+    bb.config["whitelist"] = []
+    bb.config["night_start"] = bb.config["night_end"] = 0
+    bb.config["locked_details"].update(name="Bench", desc="Bench description", pic_file_id=None, groups={})
+    bb.refresh_acl()
+    bb.config["content_rules"] = {kind: list(values) for kind, values in CONTENT_RULES.items()}
+    bb.refresh_content()
+    bb.FLOOD = bb.FloodGuard()
+    bb.CHAT_STATE.clear()
+    bb.DEAD_LETTERS.clear()
+    bb.BREAKER.circuits.clear()
+    bb.REVERT_DEBOUNCE = 0.01
+    bb.BACKOFF_BASE = 0.01
+    bb.LIMITERS.clear()
+    if args.realistic:
+        bb.GLOBAL_RATE, bb.GROUP_RATE_PER_MIN = REAL_RATES
+    else:
+        bb.GLOBAL_RATE, bb.GROUP_RATE_PER_MIN = 1e9, 1e9
+    bot = FakeBot(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after,
+    )
+    return bot, groups
+
+
+async def measure(name, size, args, trace_memory):
+    bot, groups = prepare(size, args)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        units = await SCENARIOS[name](bot, groups)
+    wall = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return bot, units, wall, peak
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="29,1000,10000", help="comma-separated group counts")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean fake API latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls raising TimedOut")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="share of calls raising RetryAfter")
+    parser.add_argument("--retry-after", type=int, default=1, help="RetryAfter seconds")
+    parser.add_argument("--realistic", action="store_true", help="keep the real Telegram rate limits")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    log_sink = open(os.devnull, "w")
+    bb.setup_logging(log_sink)  # same queue + writer thread as the bot, output discarded
+    header = f"{'scenario':<24}{'groups':>8}{'units':>9}{'wall s':>10}{'api calls':>11}{'calls/s':>11}{'units/s':>11}{'dead':>6}{'peak MiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name in args.scenarios.split(","):
+        for size in sizes:
+            bot, units, wall, _ = await measure(name, size, args, trace_memory=False)
+            calls = sum(bot.calls.values())
+            dead = len(bb.DEAD_LETTERS)
+            peak = "-"
+            if not args.no_memory:
+                _, _, _, peak_bytes = await measure(name, size, args, trace_memory=True)
+                peak = f"{peak_bytes / 2**20:.1f}"
+            print(
+                f"{name:<24}{size:>8}{units:>9}{wall:>10.2f}{calls:>11}"
+                f"{calls / wall:>11.0f}{units / wall:>11.0f}{dead:>6}{peak:>10}"
+            )
+    bb.stop_logging()
+    log_sink.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
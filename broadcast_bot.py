@@ -1,98 +1,1958 @@
 import asyncio
+import functools
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
 import os
-from datetime import datetime, timedelta
-from telegram import Update
+import queue
+import random
+import secrets
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from telegram import Chat, ChatMember, ChatPermissions, MessageEntity, Update
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
 from telegram.ext import (
     Application,
+    ChatMemberHandler,
     CommandHandler,
-    ContextTypes
+    ContextTypes,
+    ExtBot
 )
-from flask import Flask
 from threading import Thread
+from typing import NamedTuple
+from urllib.parse import urlsplit
 import os
 from telegram.ext import MessageHandler, filters # Ye line script ke top par honi chahiye
-import tempfile
+from telegram.request import HTTPXRequest
 import asyncio
+import httpx
+import tornado.web
 
-flask_app = Flask(__name__)
+# =====================================================
+# 🌐 WEB SERVER (Render health check + Telegram webhook)
+# =====================================================
+# Ek hi async server, bot wale event loop par — alag thread/Flask nahi.
 
-@flask_app.route("/")
-def home():
-    return "Bot is alive and running!"
+# Render port automatically handle karega
+PORT = int(os.environ.get("PORT", 10000))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")        # e.g. https://my-bot.onrender.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")      # checked against X-Telegram-Bot-Api-Secret-Token
+RUN_MODE = os.getenv("RUN_MODE", "webhook" if WEBHOOK_URL else "polling")  # polling = fallback
+if RUN_MODE == "webhook" and not WEBHOOK_SECRET:
+    # Bina secret ke koi bhi admin ka user id daal kar update forge kar sakta hai.
+    # Env mein na ho to har start par naya banta hai; set_webhook Telegram ko yahi deta hai.
+    WEBHOOK_SECRET = secrets.token_urlsafe(32)
+# Bot API server; point at mock_bot_api.py (e.g. http://127.0.0.1:8081) for load tests
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 
-def run_web():
-    # Render port automatically handle karega
-    port = int(os.environ.get("PORT", 10000))
-    flask_app.run(host="0.0.0.0", port=port)
 
-def start_web():
-    """Is function ko main() ke andar call karna hai"""
-    t = Thread(target=run_web)
-    t.daemon = True
-    t.start()
-    
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("Bot is alive and running!")
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Receives Telegram updates and hands them to the Application's update queue."""
+
+    def initialize(self, telegram_app):
+        self.telegram_app = telegram_app
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.telegram_app.bot)
+        except Exception:
+            raise tornado.web.HTTPError(400)
+        await self.telegram_app.update_queue.put(update)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render_metrics())
+
+
+def make_web_app(telegram_app) -> tornado.web.Application:
+    routes = [
+        (r"/", HealthHandler),
+        (r"/metrics", MetricsHandler),
+    ]
+    if RUN_MODE == "webhook":  # polling mode mein updates sirf getUpdates se aate hain
+        routes.append((rf"/{WEBHOOK_PATH}", WebhookHandler, {"telegram_app": telegram_app}))
+    return tornado.web.Application(routes)
+
+# =====================================================
+# 📈 METRICS (Prometheus text format, served on /metrics)
+# =====================================================
+# prometheus_client ki zarurat nahi — counters/histograms yahin hain.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BROADCAST_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+METRICS = []
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels=()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.values = {}
+        METRICS.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge(Counter):
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+    def render(self):
+        for line in super().render():
+            yield line.replace(" counter", " gauge") if line.startswith("# TYPE") else line
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, buckets
+        self.series = {}  # labels -> [per-bucket counts..., sum, count]
+        METRICS.append(self)
+
+    def observe(self, *labels, value: float):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for labels, row in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {row[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {row[-2]}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {row[-1]}"
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def take_metric_deltas() -> dict:
+    """Send worker side: counter / histogram values since the last call, then reset.
+
+    Workers have no /metrics of their own; the deltas ride along with the
+    outbox rows and merge_metric_deltas() adds them up in the bot process.
+    """
+    deltas = {}
+    for metric in METRICS:
+        if isinstance(metric, Gauge):
+            continue  # a last value, not a sum — meaningless across processes
+        data = metric.series if isinstance(metric, Histogram) else metric.values
+        if data:
+            deltas[metric.name] = [[list(labels), value] for labels, value in data.items()]
+            data.clear()
+    return deltas
+
+
+def merge_metric_deltas(deltas: dict):
+    by_name = {metric.name: metric for metric in METRICS}
+    for name, items in deltas.items():
+        metric = by_name.get(name)
+        for labels, value in items:
+            if isinstance(metric, Histogram):
+                row = metric.series.setdefault(tuple(labels), [0] * (len(metric.buckets) + 2))
+                for i, amount in enumerate(value):
+                    row[i] += amount
+            elif metric is not None:
+                metric.inc(*labels, amount=value)
+
+
+API_LATENCY = Histogram("bot_api_request_seconds", "Bot API call latency", ("method",))
+API_CALLS = Counter("bot_api_requests_total", "Bot API calls by result (ok or error class)", ("method", "result"))
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Handler / job execution time", ("handler",))
+HANDLER_CALLS = Counter("bot_handler_calls_total", "Handler runs by result", ("handler", "result"))
+FANOUT_SECONDS = Histogram("bot_broadcast_seconds", "Fan-out duration", ("job",), BROADCAST_BUCKETS)
+FANOUT_SENDS = Counter("bot_broadcast_sends_total", "Per-group fan-out results", ("job", "result"))
+FANOUT_RATE = Gauge("bot_broadcast_groups_per_second", "Throughput of the last fan-out", ("job",))
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call (copyMessage, setChatTitle, ...)."""
+
+    async def post(self, url: str, *args, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        start = time.monotonic()
+        result = "ok"
+        try:
+            return await super().post(url, *args, **kwargs)
+        except Exception as e:
+            result = type(e).__name__
+            raise
+        finally:
+            API_LATENCY.observe(method, value=time.monotonic() - start)
+            API_CALLS.inc(method, result)
+
+
+def timed(callback):
+    """Wrap a handler/job callback so its run time lands in bot_handler_seconds."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        result = "ok"
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            result = type(e).__name__
+            raise
+        finally:
+            HANDLER_LATENCY.observe(name, value=time.monotonic() - start)
+            HANDLER_CALLS.inc(name, result)
+
+    return wrapper
+
 
 
-# startup message (emoji removed to avoid encoding issues during import)
-print("Bot file loaded successfully")
+# =====================================================
+# 📝 LOGGING (JSON lines, background writer thread)
+# =====================================================
+# Coroutines sirf record ko queue mein daalte hain; stdout par likhna QueueListener ke
+# thread mein hota hai, to slow stdout (Render) event loop ko block nahi karta.
+# Per-message events `extra={"sample": <event>}` ke saath aate hain aur har event
+# LOG_SAMPLE per minute tak hi likha jata hai; baaki gin kar agle record mein `dropped`.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE = int(os.getenv("LOG_SAMPLE", "30"))  # sampled records per event per minute
+
+log = logging.getLogger("broadcast_bot")
+LOG_LISTENER = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; job/group/run/... come from `extra=`."""
+
+    CONTEXT = ("event", "job", "group", "run", "op", "user", "dropped", "exc")
+
+    def format(self, record) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in self.CONTEXT:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Stock QueueHandler glues the traceback onto `msg`; keep it as its own `exc` field."""
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Lets through at most `per_minute` records per `sample` key; the rest are counted."""
+
+    def __init__(self, per_minute: int):
+        super().__init__()
+        self.per_minute = per_minute
+        self.windows = {}  # key -> [window start, passed, dropped]
+
+    def filter(self, record) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        window = self.windows.get(key)
+        if window is None or record.created - window[0] >= 60:
+            if window is not None and window[2]:
+                record.dropped = window[2]  # first record of a window reports the last one's losses
+            window = self.windows[key] = [record.created, 0, 0]
+        if window[1] >= self.per_minute:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+def setup_logging(stream=None):
+    """Route every logger (ours, PTB, httpx) through a queue to a writer thread."""
+    global LOG_LISTENER
+    stop_logging()
+    records = queue.SimpleQueue()
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    LOG_LISTENER = logging.handlers.QueueListener(records, writer)
+    enqueue = QueueHandler(records)
+    enqueue.addFilter(SampleFilter(LOG_SAMPLE))  # drop in the caller, before anything is queued
+    root = logging.getLogger()
+    root.handlers[:] = [enqueue]
+    root.setLevel(LOG_LEVEL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per API call otherwise
+    LOG_LISTENER.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global LOG_LISTENER
+    if LOG_LISTENER is not None:
+        LOG_LISTENER.stop()
+        LOG_LISTENER = None
 
 # =====================================================
 # 🔐 BASIC CONFIG
 # =====================================================
 
-TOKEN = os.getenv("TOKEN")
-# Purana ADMIN_ID hata kar ye paste karein
-raw_admins = os.getenv("ADMIN_IDS", os.getenv("ADMIN_ID", "0"))
-ADMIN_IDS = [int(id.strip()) for id in raw_admins.split(",") if id.strip().isdigit()]
+TOKEN = os.getenv("TOKEN")
+# Purana ADMIN_ID hata kar ye paste karein
+raw_admins = os.getenv("ADMIN_IDS", os.getenv("ADMIN_ID", "0"))
+ADMIN_IDS = [int(id.strip()) for id in raw_admins.split(",") if id.strip().isdigit()]
+
+
+# =====================================================
+# 🧩 SEED GROUP IDS
+# =====================================================
+# Sirf pehli boot par REGISTRY isse bharta hai; uske baad groups SQLite mein rehte hain
+# aur bot add/remove hone par (my_chat_member) khud update hote hain. /addgroup, /delgroup bhi hain.
+
+GROUP_IDS = [-1002236012208, -1002417345407, -1002330831798, -1001882254820, -1002295951659, -1002350372764, -1002408686476, -1002458796542, -1002459378218, -1001787331133, -1001797945922, -1001843610820, -1002052681893, -1002126246859, -1001509387207, -1001738062150, -1001587346978, -1001829615017, -1002083172621, -1002411884866, -1001567747819, -1002254648501, -1003366623406, -1002283304339, -4557532425, -1001637428890, -1002299671203, -1002568461287, -1002538473462]
+
+# =====================================================
+# ⚙️ AUTO BROADCAST SETTINGS (IN-MEMORY, NO JSON)
+
+# Per-job storage: jobs are keyed by name (`/setjob 3 ...` -> `job_3`, or any word).
+# Each job stores scheduling info and one source message.
+# time: "HH:MM" daily, "every 45m" / "every 2h", or "cron <5 fields>"; tz: zone name (None = BOT_TZ).
+# from_chat_id/message_id: source message copied on each run.
+# is_active: whether the job is enabled.
+# last_run/next_run/last_status for diagnostics.
+# =====================================================
+# ⚙️ AUTO BROADCAST & ANTI-CHANGE SETTINGS
+# =====================================================
+
+config = {
+    "night_start": 23,
+    "night_end": 7,
+    "is_active": False,
+    "blacklist": [],
+    "whitelist": [],
+    "locked_details": {
+        "name": None,
+        "desc": None,
+        "pic_file_id": None,
+        "groups": {} 
+    },
+    "quiet_hours": {},  # str(gid) -> [start_hour, end_hour] IST; overrides night mode for that group
+    "content_rules": {"words": [], "links": [], "channels": []},  # /filter; compiled into CONTENT
+}
+
+config["jobs"] = {}  # name -> record, created by /setjob (any number of jobs)
+
+
+def new_job_record() -> dict:
+    return {
+        "time": None,
+        "tz": None,
+        "from_chat_id": None,
+        "message_id": None,
+        "is_active": False,
+        "last_run": None,
+        "next_run": None,
+        "last_status": "stopped",
+        "target_group": None
+    }
+
+# =====================================================
+# 💾 PERSISTENCE (SQLite WAL)
+# =====================================================
+# `config` hi in-memory mirror hai — saare reads wahin se hote hain.
+# Har change ke baad `save(<key>)` call karo; write background thread mein batch hota hai.
+# Keys: night_start, night_end, quiet_hours, is_active, blacklist, whitelist, content_rules, locked_details, jobs.<name>
+
+DB_PATH = os.getenv("DB_PATH", "bot_state.db")
+
+
+class Store:
+    """Tiny key/value store on SQLite in WAL mode with a batching writer thread.
+
+    Besides the `kv` table, subsystems keep their own tables (see SCHEMA) and
+    queue plain SQL through `execute()`; it is committed with the same batch.
+    """
+
+    FLUSH_INTERVAL = 0.5  # seconds between batched commits
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS groups (chat_id INTEGER PRIMARY KEY, status TEXT NOT NULL, position INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS shards (chat_id INTEGER PRIMARY KEY, bot_id INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT NOT NULL, lane INTEGER NOT NULL,"
+        " kind TEXT NOT NULL, chat_id INTEGER NOT NULL, payload TEXT NOT NULL,"
+        " status TEXT NOT NULL DEFAULT 'queued', result TEXT)",
+        "CREATE INDEX IF NOT EXISTS outbox_lane ON outbox (lane, status, id)",
+        "CREATE INDEX IF NOT EXISTS outbox_batch ON outbox (batch, status)",
+        "CREATE TABLE IF NOT EXISTS outbox_metrics (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS runs ("
+        " run_id TEXT PRIMARY KEY, label TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+        " targets TEXT NOT NULL, done BLOB NOT NULL, notify_chat INTEGER, started TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS ledger ("
+        " run_id TEXT PRIMARY KEY, label TEXT NOT NULL, kind TEXT NOT NULL, started TEXT NOT NULL,"
+        " chats BLOB NOT NULL, messages BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS pins (chat_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS circuits ("
+        " chat_id INTEGER PRIMARY KEY, failures INTEGER NOT NULL, opened REAL NOT NULL,"
+        " cooldown REAL NOT NULL, error TEXT)",
+        "CREATE TABLE IF NOT EXISTS deferred ("
+        " label TEXT NOT NULL, chat_id INTEGER NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+        " release_at REAL NOT NULL, PRIMARY KEY (label, chat_id))",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending = {}  # key -> JSON text, None = delete (latest write wins)
+        self.ops = []      # queued (sql, params), applied in order after the kv batch
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        conn = self._connect()
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+        self.thread = Thread(target=self._writer, name="store-writer", daemon=True)
+        self.thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self) -> dict:
+        conn = self._connect()
+        try:
+            return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM kv")}
+        finally:
+            conn.close()
+
+    def query(self, sql: str, params=()) -> list:
+        """Synchronous read on a fresh connection — startup only, never from a handler."""
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def put(self, key: str, value):
+        # Serialise on the caller side so the writer sees a snapshot, not a live dict
+        data = json.dumps(value)
+        with self.lock:
+            self.pending[key] = data
+        self.wake.set()
+
+    def delete(self, key: str):
+        # Same map as put(): a delete and a re-create in one batch keep their order
+        with self.lock:
+            self.pending[key] = None
+        self.wake.set()
+
+    def execute(self, sql: str, params=()):
+        with self.lock:
+            self.ops.append((sql, params))
+        self.wake.set()
+
+    def flush(self, conn: sqlite3.Connection):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            ops, self.ops = self.ops, []
+        if batch or ops:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                    [(key, value) for key, value in batch.items() if value is not None],
+                )
+                conn.executemany("DELETE FROM kv WHERE key = ?", [(key,) for key, value in batch.items() if value is None])
+                for sql, params in ops:
+                    conn.execute(sql, params)
+
+    def _writer(self):
+        conn = self._connect()
+        while not self.closed:
+            self.wake.wait()
+            time.sleep(self.FLUSH_INTERVAL)  # coalesce bursts of changes into one commit
+            self.wake.clear()
+            try:
+                self.flush(conn)
+            except Exception as e:
+                log.exception("❌ Store flush failed: %s", e)
+        self.flush(conn)
+        conn.close()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join(timeout=10)
+
+
+STORE = None  # opened in main(); save() is a no-op until then
+
+
+def save(*keys: str):
+    """Queue a write of config[key] (or config["jobs"][name] for "jobs.<name>")."""
+    if STORE is None:
+        return
+    for key in keys:
+        if key.startswith("jobs."):
+            record = config["jobs"].get(key[5:])
+            if record is not None:  # deleted by /deljob while a run was still going
+                STORE.put(key, record)
+        else:
+            STORE.put(key, config[key])
+
+
+def open_store(path: str = DB_PATH):
+    """Open the DB and load saved values over the defaults in `config`."""
+    global STORE
+    STORE = Store(path)
+    saved = STORE.load()
+    for key, value in saved.items():
+        if key.startswith("jobs."):
+            config["jobs"].setdefault(key[5:], new_job_record()).update(value)
+        else:
+            config[key] = value
+    refresh_acl()
+    refresh_quiet()
+    refresh_content()
+    log.info("💾 Loaded %d saved keys from %s", len(saved), path)
+    REGISTRY.load(STORE.query("SELECT chat_id, status, position FROM groups"))
+    SHARDS.update(STORE.query("SELECT chat_id, bot_id FROM shards"))
+    for row in STORE.query("SELECT run_id, label, kind, payload, targets, done, notify_chat, started FROM runs"):
+        run = RunCheckpoint(row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4]), row[5], row[6], row[7])
+        RUNS[run.run_id] = run
+    if RUNS:
+        log.info("🧷 %d interrupted run(s) will resume after startup", len(RUNS))
+    LEDGER.load(
+        STORE.query("SELECT run_id, label, kind, started, chats, messages FROM ledger ORDER BY started"),
+        STORE.query("SELECT chat_id, message_id FROM pins"),
+    )
+    DEFERRED.load(STORE.query("SELECT label, chat_id, kind, payload, release_at FROM deferred"))
+    BREAKER.load(STORE.query("SELECT chat_id, failures, opened, cooldown, error FROM circuits"))
+
+
+# =====================================================
+# 🗂 GROUP REGISTRY
+# =====================================================
+
+class GroupRegistry:
+    """Every known group in serial (/setgname numbering) order.
+
+    Status is "active", "pending" (bot added by a non-admin — needs /addgroup)
+    or "left" (bot removed/kicked). Fan-outs iterate `active()`, a cached
+    tuple; membership and serial lookups are dict hits, so 10k+ groups is fine.
+    """
+
+    def __init__(self, seed=()):
+        self.groups = {}  # gid -> [status, position]
+        self.next_position = 1
+        self._active = None
+        self._serial = None
+        for gid in seed:
+            self.set_status(gid, "active")
+
+    def load(self, rows):
+        """Replace the seed with saved rows; on first boot persist the seed instead."""
+        if not rows:
+            for gid in self.groups:
+                self._persist(gid)
+            return
+        self.groups = {gid: [status, position] for gid, status, position in sorted(rows, key=lambda r: r[2])}
+        self.next_position = max(position for _, _, position in rows) + 1
+        self._changed()
+
+    def _changed(self):
+        self._active = None
+        self._serial = None
+
+    def _persist(self, gid):
+        if STORE is not None:
+            status, position = self.groups[gid]
+            STORE.execute(
+                "INSERT OR REPLACE INTO groups (chat_id, status, position) VALUES (?, ?, ?)",
+                (gid, status, position),
+            )
+
+    def __contains__(self, gid) -> bool:
+        entry = self.groups.get(gid)
+        return entry is not None and entry[0] == "active"
+
+    def __len__(self) -> int:
+        return len(self.active())
+
+    def status(self, gid):
+        entry = self.groups.get(gid)
+        return entry[0] if entry else None
+
+    def active(self) -> tuple:
+        if self._active is None:
+            self._active = tuple(gid for gid, (status, _) in self.groups.items() if status == "active")
+        return self._active
+
+    def serial(self, gid):
+        """1-based position among active groups (the 01., 02. ... title prefix)."""
+        if self._serial is None:
+            self._serial = {gid: index for index, gid in enumerate(self.active(), start=1)}
+        return self._serial.get(gid)
+
+    def with_status(self, status: str) -> list:
+        return [gid for gid, (s, _) in self.groups.items() if s == status]
+
+    def set_status(self, gid, status: str) -> bool:
+        entry = self.groups.get(gid)
+        if entry is None:
+            self.groups[gid] = [status, self.next_position]
+            self.next_position += 1
+        elif entry[0] == status:
+            return False
+        else:
+            entry[0] = status
+        self._changed()
+        self._persist(gid)
+        return True
+
+    def migrate(self, old, new):
+        """Group -> supergroup upgrade: new ID takes over the old one's place and status."""
+        entry = self.groups.get(old)
+        if entry is None or old == new:
+            return
+        self.groups = {(new if gid == old else gid): value for gid, value in self.groups.items()}
+        self._changed()
+        if STORE is not None:
+            STORE.execute("DELETE FROM groups WHERE chat_id = ?", (old,))
+        self._persist(new)
+
+
+REGISTRY = GroupRegistry(GROUP_IDS)
+
+
+def remap_group(old, new):
+    """Move everything we key by chat ID from a migrated group to its new supergroup."""
+    REGISTRY.migrate(old, new)
+    if old in CHAT_STATE:
+        CHAT_STATE[new] = CHAT_STATE.pop(old)
+    if old in CHAT_META:
+        CHAT_META[new] = CHAT_META.pop(old)
+    if old in CAPS:
+        CAPS[new] = CAPS.pop(old)
+    BREAKER.forget(old)  # the new ID starts with a clean record
+    for key in [key for key in HELPER_CAPS if key[0] == old]:
+        HELPER_CAPS[(new, key[1])] = HELPER_CAPS.pop(key)
+    if old in SHARDS:
+        bot_id = SHARDS.pop(old)
+        SHARDS[new] = bot_id
+        if STORE is not None:
+            STORE.execute("UPDATE shards SET chat_id = ? WHERE chat_id = ?", (new, old))
+    overrides = config["locked_details"].get("groups", {})
+    if str(old) in overrides:
+        overrides[str(new)] = overrides.pop(str(old))
+        save("locked_details")
+    for name, rec in config["jobs"].items():
+        if rec.get("target_group") == old:
+            rec["target_group"] = new
+            save(f"jobs.{name}")
+    log.info("🔀 Group migrated: %s → %s", old, new, extra={"group": new})
+
+
+# =====================================================
+# 🚦 RATE LIMITER + FAN-OUT ENGINE
+# =====================================================
+# Telegram limits: ~30 msg/sec per bot overall, ~20 msg/min inside one group.
+# Saare bulk sends `tg_call` se guzarte hain, isliye speed sirf in limits par depend karti hai.
+
+GLOBAL_RATE = float(os.getenv("GLOBAL_RATE", "25"))            # API calls/sec (all chats)
+GROUP_RATE_PER_MIN = float(os.getenv("GROUP_RATE_PER_MIN", "20"))  # API calls/min per group
+GLOBAL_BURST = 5                                                 # burst + rate must stay < 30 in any 1s window
+GROUP_BURST = 3                                                  # short burst allowed per group
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "30"))  # max in-flight requests
+
+# Retry policy: flood-wait (RetryAfter) ka exact wait, network errors par jittered backoff
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0     # seconds, doubled every attempt
+BACKOFF_MAX = 30.0
+DEAD_LETTER_MAX = 500  # permanent failures kept for /deadletters and /replay
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    `reserve()` always takes a token (balance may go negative) and returns how
+    long the caller has to sleep before using it.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """One global bucket for the bot plus one small bucket per chat."""
+
+    def __init__(self, rate: float = GLOBAL_RATE, group_per_min: float = GROUP_RATE_PER_MIN):
+        self.global_bucket = TokenBucket(rate, min(GLOBAL_BURST, max(1.0, rate)))
+        self.group_rate = group_per_min / 60
+        self.chats = {}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            bucket = self.chats[chat_id] = TokenBucket(self.group_rate, GROUP_BURST)
+        return bucket
+
+    async def acquire(self, chat_id=None):
+        now = time.monotonic()
+        wait = self.global_bucket.reserve(now)
+        if chat_id is not None:
+            wait = max(wait, self._chat_bucket(chat_id).reserve(now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, chat_id, seconds: float):
+        """Hold back every caller of this chat (or all chats) for `seconds` after a 429."""
+        bucket = self.global_bucket if chat_id is None else self._chat_bucket(chat_id)
+        bucket.refill(time.monotonic())
+        # next reserve() lands exactly `seconds` from now
+        bucket.tokens = min(bucket.tokens, 1 - seconds * bucket.rate)
+
+
+LIMITERS = {}  # id(bot) -> RateLimiter; every token has its own Telegram budget
+
+
+def limiter_for(bot) -> RateLimiter:
+    limiter = LIMITERS.get(id(bot))
+    if limiter is None:
+        limiter = LIMITERS[id(bot)] = RateLimiter(GLOBAL_RATE, GROUP_RATE_PER_MIN)
+    return limiter
+
+# Permanent failures: {"method", "bot", "kwargs", "error", "at"}
+DEAD_LETTERS = deque(maxlen=DEAD_LETTER_MAX)
+
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts / connection drops are worth retrying; BadRequest & Forbidden are not."""
+    return isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+
+
+def creates_message(method) -> bool:
+    """send_* / copy_* / forward_*: a repeat after Telegram got the first try posts twice."""
+    return method.__name__.startswith(("send_", "copy_", "forward_"))
+
+
+def never_sent(error: Exception) -> bool:
+    """The request provably didn't reach Telegram (connect failed, pool full)."""
+    return isinstance(error.__cause__, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def retry_delay(error: RetryAfter) -> float:
+    wait = error.retry_after
+    return wait.total_seconds() if isinstance(wait, timedelta) else float(wait)
+
+
+async def tg_call(method, *, dead_letter: bool = True, **kwargs):
+    """Call a bound Bot API method (e.g. `context.bot.copy_message`) under that bot's limiter.
+
+    Pass everything as keyword arguments; `chat_id` selects the per-group bucket.
+    RetryAfter waits exactly as long as Telegram asks, transient network errors
+    back off exponentially with jitter — for message-creating methods only when
+    the request never went out (see never_sent). When retries run out (or the error is
+    permanent) the call goes to DEAD_LETTERS and the error is re-raised.
+    """
+    chat_id = kwargs.get("chat_id")
+    limiter = limiter_for(method.__self__)
+    attempt = 0
+    while True:
+        await limiter.acquire(chat_id)
+        try:
+            return await method(**kwargs)
+        except RetryAfter as e:
+            if attempt >= MAX_RETRIES:
+                error = e
+            else:
+                limiter.pause(chat_id, retry_delay(e))
+                attempt += 1
+                continue
+        except ChatMigrated as e:
+            # Group supergroup ban gaya — naya ID yaad rakho aur wahin bhejo
+            remap_group(chat_id, e.new_chat_id)
+            if attempt >= MAX_RETRIES:
+                error = e
+            else:
+                chat_id = kwargs["chat_id"] = e.new_chat_id
+                attempt += 1
+                continue
+        except Exception as e:
+            # A group that already failed recently gets one retry, not MAX_RETRIES × read_timeout
+            retries = 1 if BREAKER.suspect(chat_id) else MAX_RETRIES
+            # TimedOut on a read may mean the post went out: don't send it again
+            retryable = is_transient(e) and (never_sent(e) or not creates_message(method))
+            if retryable and attempt < retries:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                attempt += 1
+                continue
+            error = e
+
+        cap = METHOD_CAPS.get(method.__name__)
+        if cap and is_rights_error(error):
+            lost_right(method.__self__.id, chat_id, cap)
+        if isinstance(error, Forbidden) and chat_id in REGISTRY:
+            # Bot kicked / no longer a member: stop spending calls on this chat
+            REGISTRY.set_status(chat_id, "left")
+        # Attached to the error too, so send workers can report it back to the bot process
+        error.dead_letter = {
+            "method": method.__name__,
+            "bot": method.__self__,
+            "kwargs": kwargs,
+            "error": f"{type(error).__name__}: {error}",
+            "at": get_ist_now().strftime("%d-%m %H:%M:%S"),
+        }
+        if dead_letter:
+            DEAD_LETTERS.append(error.dead_letter)
+        raise error
+
+
+async def fan_out(group_ids, send, concurrency: int = FANOUT_CONCURRENCY, label: str = None, on_result=None,
+                  breaker: bool = True) -> dict:
+    """Run `send(gid)` for every group concurrently and collect per-group results.
+
+    Returns {gid: result or Exception}. Pacing comes from `tg_call`, so
+    `concurrency` only caps how many requests are in flight at once — per
+    shard, since every bot token has its own rate budget (see SHARDS).
+    `label` (job / command name) tags the broadcast metrics; `on_result(gid, result)`
+    is called as each group finishes (progress tracking). Quarantined groups
+    (see CircuitBreaker) are not called and come back as `Quarantined`;
+    `breaker=False` for fan-outs over something other than group IDs.
+    """
+    group_ids = list(group_ids)
+    results = {}
+    start = time.monotonic()
+    if breaker:
+        group_ids, skipped = BREAKER.split(group_ids)
+        for gid in skipped:
+            results[gid] = Quarantined(gid)
+            if on_result is not None:
+                on_result(gid, results[gid])
+
+    by_shard = {}
+    for gid in group_ids:
+        by_shard.setdefault(SHARDS.get(gid), []).append(gid)
+
+    async def worker(pending):
+        for gid in pending:
+            try:
+                results[gid] = await send(gid)
+            except Exception as e:
+                results[gid] = e
+            if breaker:
+                BREAKER.record(gid, results[gid])
+            if on_result is not None:
+                on_result(gid, results[gid])
+
+    workers = []
+    for ids in by_shard.values():
+        pending = iter(ids)
+        workers.extend(worker(pending) for _ in range(min(concurrency, len(ids))))
+    await asyncio.gather(*workers)
+
+    if label:
+        record_fanout(label, results, time.monotonic() - start)
+    return results
+
+
+def record_fanout(label: str, results: dict, elapsed: float):
+    ok = count_ok(results)
+    skipped = count_quarantined(results)
+    FANOUT_SECONDS.observe(label, value=elapsed)
+    FANOUT_SENDS.inc(label, "ok", amount=ok)
+    FANOUT_SENDS.inc(label, "error", amount=len(results) - ok - skipped)
+    FANOUT_SENDS.inc(label, "quarantined", amount=skipped)
+    FANOUT_RATE.set(label, value=len(results) / elapsed if elapsed else 0)
+
+
+def count_ok(results: dict) -> int:
+    return sum(1 for r in results.values() if not isinstance(r, Exception))
+
+
+def count_quarantined(results: dict) -> int:
+    return sum(1 for r in results.values() if isinstance(r, Quarantined))
+
+
+def failed_note(results: dict) -> str:
+    skipped = count_quarantined(results)
+    failed = len(results) - count_ok(results) - skipped
+    note = f"\n⚠️ {failed} failed — check /deadletters" if failed else ""
+    if skipped:
+        note += f"\n🩺 {skipped} quarantined groups skipped — see /status health"
+    return note
+
+
+# =====================================================
+# 🩺 GROUP HEALTH (circuit breaker)
+# =====================================================
+# Jo group baar baar fail hota hai (kicked, restricted, timeout) uska circuit "open" ho
+# jata hai: fan-outs use skip karte hain aur background mein har cooldown ke baad ek
+# sasta probe (get_chat_member) jata hai — "half-open". Probe pass = closed, fail =
+# cooldown double. Ek dead group ab broadcast ko minute bhar nahi rokta.
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))        # consecutive soft failures to open
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "600"))    # seconds before the first probe
+BREAKER_MAX_COOLDOWN = 6 * 3600
+BREAKER_TICK = 30.0  # seconds between looks for circuits due a probe
+
+# Errors that say "we can't send to this chat" — open at once, no need to count.
+# A missing admin right (pin, change info, ...) is not one: tg_call clears that bit in CAPS.
+HARD_ERRORS = (
+    "chat not found", "rights to send", "chat_write_forbidden", "chat_restricted",
+    "bot was kicked", "bot is not a member", "group chat was deactivated",
+)
+
+
+class Quarantined(Exception):
+    """Result for a group skipped because its circuit is open."""
+
+    def __init__(self, gid):
+        super().__init__(f"group {gid} is quarantined (circuit open)")
+
+
+def error_class(error: Exception):
+    """'hard' (open now), 'soft' (count it) or None (not the group's fault, e.g. RetryAfter)."""
+    text = str(error) if isinstance(error, QueuedSendError) else f"{type(error).__name__}: {error}"
+    low = text.lower()
+    if isinstance(error, Forbidden) or low.startswith("forbidden") or any(k in low for k in HARD_ERRORS):
+        return "hard"
+    if is_transient(error) or low.startswith(("timedout", "networkerror")):
+        return "soft"
+    return None
+
+
+class Circuit:
+    __slots__ = ("state", "failures", "opened", "cooldown", "error")
+
+    def __init__(self):
+        self.state = "closed"  # closed -> open -> half-open -> closed / open
+        self.failures = 0      # consecutive
+        self.opened = 0.0      # epoch time the circuit last opened
+        self.cooldown = BREAKER_COOLDOWN
+        self.error = None
+
+
+class CircuitBreaker:
+    """Per-group health; only groups with recent failures have an entry."""
+
+    def __init__(self):
+        self.circuits = {}  # gid -> Circuit
+        self.task = None
+
+    def load(self, rows):
+        for gid, failures, opened, cooldown, error in rows:
+            circuit = self.circuits[gid] = Circuit()
+            circuit.state, circuit.failures, circuit.opened, circuit.cooldown, circuit.error = (
+                "open", failures, opened, cooldown, error
+            )
+
+    def suspect(self, gid) -> bool:
+        return gid in self.circuits
+
+    def split(self, group_ids):
+        """(groups to send to, quarantined groups)."""
+        if not self.circuits:
+            return list(group_ids), []
+        ok, skipped = [], []
+        for gid in group_ids:
+            circuit = self.circuits.get(gid)
+            (ok if circuit is None or circuit.state == "closed" else skipped).append(gid)
+        return ok, skipped
+
+    def quarantined(self) -> list:
+        return [(gid, c) for gid, c in self.circuits.items() if c.state != "closed"]
+
+    def record(self, gid, result):
+        if not isinstance(result, Exception):
+            if gid in self.circuits and self.circuits[gid].state == "closed":
+                del self.circuits[gid]
+            return
+        kind = error_class(result)
+        if kind is None:
+            return
+        circuit = self.circuits.get(gid)
+        if circuit is None:
+            circuit = self.circuits[gid] = Circuit()
+        circuit.failures += 1
+        circuit.error = str(result)[:200]
+        if circuit.state == "closed" and (kind == "hard" or circuit.failures >= BREAKER_FAILURES):
+            self._open(gid, circuit, BREAKER_COOLDOWN)
+
+    def _open(self, gid, circuit, cooldown):
+        circuit.state = "open"
+        circuit.opened = time.time()
+        circuit.cooldown = cooldown
+        log.warning("🩺 Circuit open for %s (%d failures, next probe in %.0fs): %s",
+                    gid, circuit.failures, cooldown, circuit.error, extra={"group": gid})
+        if STORE is not None:
+            STORE.execute(
+                "INSERT OR REPLACE INTO circuits (chat_id, failures, opened, cooldown, error) VALUES (?, ?, ?, ?, ?)",
+                (gid, circuit.failures, circuit.opened, cooldown, circuit.error),
+            )
+
+    def forget(self, gid):
+        if self.circuits.pop(gid, None) is not None and STORE is not None:
+            STORE.execute("DELETE FROM circuits WHERE chat_id = ?", (gid,))
+
+    def start(self, bot):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(bot))
+
+    async def _run(self, bot):
+        while True:
+            await asyncio.sleep(BREAKER_TICK)
+            now = time.time()
+            due = [gid for gid, c in self.circuits.items() if c.state == "open" and now - c.opened >= c.cooldown]
+            if due:
+                await fan_out(due, functools.partial(self.probe, bot), label="breaker_probe", breaker=False)
+
+    async def probe(self, bot, gid):
+        """Half-open: one get_chat_member decides between closed and a longer open."""
+        circuit = self.circuits.get(gid)
+        if circuit is None:
+            return
+        circuit.state = "half-open"
+        member_bot = bot_for(gid, bot)
+        try:
+            member = await tg_call(member_bot.get_chat_member, dead_letter=False, chat_id=gid, user_id=member_bot.id)
+            if member.status in (ChatMember.LEFT, ChatMember.BANNED) or (
+                member.status == ChatMember.RESTRICTED and not member.can_send_messages
+            ):
+                raise Forbidden(f"bot is {member.status} in this chat")
+        except Exception as e:
+            circuit.failures += 1
+            circuit.error = f"{type(e).__name__}: {e}"[:200]
+            self._open(gid, circuit, min(BREAKER_MAX_COOLDOWN, circuit.cooldown * 2))
+            return
+        log.info("🩺 Circuit closed for %s after %d failures", gid, circuit.failures, extra={"group": gid})
+        self.forget(gid)
+
+
+BREAKER = CircuitBreaker()
+
+
+# =====================================================
+# 📈 BULK OPERATIONS (live progress + /cancel)
+# =====================================================
+# Har bulk command background task ban kar chalta hai: ek hi status message har
+# PROGRESS_EVERY seconds mein edit hota hai (per-group koi extra API call nahi).
+
+PROGRESS_EVERY = 3.0  # seconds between progress edits
+
+
+class Operation:
+    """A running fan-out with an ID, counters and the task that can be cancelled."""
+
+    ids = itertools.count(1)
+
+    def __init__(self, label: str, total: int):
+        self.id = next(Operation.ids)
+        self.label = label
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.task = None
+        self.suspended = False  # cancelled by shutdown, not by /cancel — the run resumes later
+
+    def record(self, gid, result):
+        if isinstance(result, Exception):
+            self.failed += 1
+        else:
+            self.sent += 1
+
+    @property
+    def left(self) -> int:
+        return max(0, self.total - self.sent - self.failed)
+
+    def render(self) -> str:
+        done = self.sent + self.failed
+        elapsed = time.monotonic() - self.started
+        eta = f"{self.left * elapsed / done:.0f}s" if done else "?"
+        return (
+            f"⏳ #{self.id} {self.label}: {self.sent} sent • {self.failed} failed • "
+            f"{self.left} left • ETA {eta}\n/cancel {self.id}"
+        )
+
+    async def run(self, bot, chat_id, work, finish):
+        status = None
+        if chat_id is not None:
+            try:
+                status = await tg_call(bot.send_message, dead_letter=False, chat_id=chat_id, text=self.render())
+            except Exception as e:
+                log.warning("⚠️ #%d progress message failed: %s", self.id, e, extra={"op": self.id})
+        reporter = asyncio.create_task(self._report(bot, status)) if status else None
+        try:
+            text = finish(await work(self))
+        except asyncio.CancelledError:
+            if self.suspended:
+                text = f"⏸ #{self.id} {self.label} paused for restart: {self.sent} sent, {self.left} left — resumes on startup."
+            else:
+                text = f"🛑 #{self.id} {self.label} cancelled: {self.sent} sent, {self.failed} failed, {self.left} not sent."
+        except Exception as e:
+            log.exception("❌ #%d %s crashed: %s", self.id, self.label, e, extra={"op": self.id})
+            text = f"❌ #{self.id} {self.label} stopped: {e}"
+        finally:
+            OPERATIONS.pop(self.id, None)
+            if reporter:
+                reporter.cancel()
+        log.info(text, extra={"op": self.id})
+        if chat_id is not None and not (status and await self._edit(bot, status, text)):
+            try:
+                await tg_call(bot.send_message, dead_letter=False, chat_id=chat_id, text=text)
+            except Exception as e:
+                log.warning("⚠️ #%d result message failed: %s", self.id, e, extra={"op": self.id})
+
+    async def _report(self, bot, status):
+        shown = None
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY)
+            text = self.render()
+            if text != shown:
+                await self._edit(bot, status, text)
+                shown = text
+
+    @staticmethod
+    async def _edit(bot, status, text) -> bool:
+        try:
+            await tg_call(
+                bot.edit_message_text, dead_letter=False,
+                chat_id=status.chat_id, message_id=status.message_id, text=text,
+            )
+            return True
+        except Exception:
+            return False  # progress is best effort ("message is not modified" etc.)
+
+
+OPERATIONS = {}  # id -> running Operation
+
+
+def launch(bot, chat_id, label: str, total: int, work, finish) -> Operation:
+    """Run `work(op)` in the background as a cancellable bulk operation.
+
+    One status message in `chat_id` (None = log only) tracks progress and
+    ends up as `finish(results)`.
+    """
+    op = Operation(label, total)
+    OPERATIONS[op.id] = op
+    op.task = asyncio.create_task(op.run(bot, chat_id, work, finish))
+    return op
+
+
+def start_operation(update: Update, context: ContextTypes.DEFAULT_TYPE, label: str, total: int, work, finish) -> Operation:
+    """`launch` for a command: the handler returns at once, other updates keep flowing."""
+    return launch(context.bot, update.effective_chat.id, label, total, work, finish)
+
+
+async def suspend_operations():
+    """Shutdown: stop running fan-outs but keep their checkpoints for the next start."""
+    ops = list(OPERATIONS.values())
+    for op in ops:
+        op.suspended = True
+        op.task.cancel()
+    await asyncio.gather(*(op.task for op in ops), return_exceptions=True)
+
+
+def track_current(label: str, total: int) -> Operation:
+    """Register the running task (e.g. a scheduled job) so /cancel can stop it."""
+    op = Operation(label, total)
+    op.task = asyncio.current_task()
+    OPERATIONS[op.id] = op
+    return op
+
+
+# =====================================================
+# 🤝 MULTI-TOKEN SHARDS
+# =====================================================
+# EXTRA_TOKENS=tok2,tok3 — helper bots jo groups mein admin hain. Har group ek stable
+# bot ko assign hota hai; broadcast/pin/auto jobs/setgname usi bot se jaate hain, to
+# har token ka apna ~30 msg/s budget milta hai. Admin commands primary bot par hi rehte hain.
+#
+# Helper bots admin ke private chat ka message copy nahi kar sakte, isliye source message
+# pehle STAGING_CHAT_ID (jahan saare bots member hain) mein ek baar copy hota hai.
+
+EXTRA_TOKENS = [t.strip() for t in os.getenv("EXTRA_TOKENS", "").split(",") if t.strip()]
+STAGING_CHAT_ID = int(os.getenv("STAGING_CHAT_ID", "0")) or None
+
+BOTS = {}       # bot id -> Bot (primary + helpers), filled in serve()
+SHARDS = {}     # gid -> bot id; groups not in here use the primary bot
+HELPER_CAPS = {}  # (gid, helper bot id) -> CAN_* bitmask, from probe_shards
+STAGED = {}     # (from_chat_id, message_id) -> Task resolving to the staged copy
+
+
+def bot_for(gid, primary):
+    """Bot that sends to this group (falls back to the primary bot)."""
+    return BOTS.get(SHARDS.get(gid), primary)
+
+
+def assign_shard(gid, bot_id, primary_id):
+    if bot_id == primary_id:
+        bot_id = None
+    if SHARDS.get(gid) == bot_id:
+        return
+    if bot_id is None:
+        SHARDS.pop(gid, None)
+    else:
+        SHARDS[gid] = bot_id
+    if STORE is not None:
+        if bot_id is None:
+            STORE.execute("DELETE FROM shards WHERE chat_id = ?", (gid,))
+        else:
+            STORE.execute("INSERT OR REPLACE INTO shards (chat_id, bot_id) VALUES (?, ?)", (gid, bot_id))
+
+
+async def probe_shards(primary) -> dict:
+    """Find which helper bots are admin in each group and spread groups across them.
+
+    Existing assignments are kept while that bot is still an admin there, so a
+    group only moves when it has to.
+    """
+    helpers = [bot for bot_id, bot in BOTS.items() if bot_id != primary.id]
+    if not helpers:
+        return {}
+
+    async def probe(gid):
+        candidates = [primary.id]
+        for helper in helpers:
+            try:
+                member = await tg_call(helper.get_chat_member, dead_letter=False, chat_id=gid, user_id=helper.id)
+                if member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER):
+                    candidates.append(helper.id)
+                    HELPER_CAPS[(gid, helper.id)] = caps_from_member(member)
+                else:
+                    HELPER_CAPS.pop((gid, helper.id), None)
+            except Exception:
+                pass
+        current = SHARDS.get(gid)
+        chosen = current if current in candidates else candidates[abs(gid) % len(candidates)]
+        assign_shard(gid, chosen, primary.id)
+        return chosen
+
+    results = await fan_out(REGISTRY.active(), probe, label="shard_probe")
+    log.info("🤝 Shards: %d groups on %d helper bot(s), rest on primary", len(SHARDS), len(helpers))
+    return results
+
+
+async def copy_to(gid, primary, from_chat_id, message_id):
+    """copy_message via this group's shard bot; helper bots copy from the staging chat."""
+    bot = bot_for(gid, primary)
+    if bot is not primary:
+        if STAGING_CHAT_ID is None:
+            bot = primary
+        else:
+            key = (from_chat_id, message_id)
+            task = STAGED.get(key)
+            if task is None or (task.done() and task.exception()):
+                task = STAGED[key] = asyncio.ensure_future(tg_call(
+                    primary.copy_message,
+                    chat_id=STAGING_CHAT_ID,
+                    from_chat_id=from_chat_id,
+                    message_id=message_id,
+                ))
+            staged = await task
+            from_chat_id, message_id = STAGING_CHAT_ID, staged.message_id
+    msg = await tg_call(bot.copy_message, chat_id=gid, from_chat_id=from_chat_id, message_id=message_id)
+    return bot, msg
+
+
+def make_bot(token: str) -> ExtBot:
+    """Send-only bot for a token (helpers, send workers) — same API URL and request setup."""
+    return ExtBot(
+        token,
+        base_url=f"{TELEGRAM_API_URL}/bot",
+        base_file_url=f"{TELEGRAM_API_URL}/file/bot",
+        request=InstrumentedRequest(connection_pool_size=20, read_timeout=60, write_timeout=60),
+    )
+
+
+# =====================================================
+# 🔑 BOT RIGHTS (per-group capability cache)
+# =====================================================
+# Startup par har group mein bot ka get_chat_member; my_chat_member updates se
+# refresh hota hai. Bulk commands un groups ko pehle hi chhod dete hain jahan call
+# fail hi hogi. Jis group ka probe nahi hua (CAPS mein nahi) wahan try karte hain.
+
+CAN_PIN, CAN_CHANGE_INFO, CAN_DELETE, CAN_INVITE, CAN_RESTRICT = 1, 2, 4, 8, 16
+CAN_ALL = CAN_PIN | CAN_CHANGE_INFO | CAN_DELETE | CAN_INVITE | CAN_RESTRICT
+CAP_FIELDS = (
+    (CAN_PIN, "can_pin_messages", "pin messages"),
+    (CAN_CHANGE_INFO, "can_change_info", "change group info"),
+    (CAN_DELETE, "can_delete_messages", "delete messages"),
+    (CAN_INVITE, "can_invite_users", "invite users"),
+    (CAN_RESTRICT, "can_restrict_members", "restrict members"),
+)
+CAP_NAMES = {cap: name for cap, _, name in CAP_FIELDS}
+
+CAPS = {}  # gid -> CAN_* bitmask of the primary bot there
+
+
+def caps_from_member(member) -> int:
+    if member.status == ChatMember.OWNER:
+        return CAN_ALL
+    if member.status not in (ChatMember.ADMINISTRATOR, ChatMember.RESTRICTED):
+        return 0
+    mask = 0
+    for cap, field, _ in CAP_FIELDS:
+        if getattr(member, field, False):
+            mask |= cap
+    return mask
+
+
+def can(gid, cap: int) -> bool:
+    """False only when the probe says the primary bot lacks `cap` there."""
+    mask = CAPS.get(gid)
+    return mask is None or bool(mask & cap)
+
+
+# Bot API method -> the admin right it needs (for rights errors from tg_call)
+METHOD_CAPS = {
+    "pin_chat_message": CAN_PIN, "unpin_chat_message": CAN_PIN, "unpin_all_chat_messages": CAN_PIN,
+    "set_chat_title": CAN_CHANGE_INFO, "set_chat_description": CAN_CHANGE_INFO, "set_chat_photo": CAN_CHANGE_INFO,
+    "delete_message": CAN_DELETE, "delete_messages": CAN_DELETE,
+    "export_chat_invite_link": CAN_INVITE, "restrict_chat_member": CAN_RESTRICT,
+}
+RIGHTS_ERRORS = ("not enough rights", "have no rights", "need administrator rights", "chat_admin_required")
+
+
+def is_rights_error(error: Exception) -> bool:
+    low = str(error).lower()
+    return any(k in low for k in RIGHTS_ERRORS)
+
+
+def lost_right(bot_id, gid, cap: int):
+    """A call failed for lack of `cap`: remember it so the next bulk command skips the group."""
+    if gid is None:
+        return
+    helper = SHARDS.get(gid) == bot_id
+    mask = HELPER_CAPS.get((gid, bot_id), CAN_ALL) if helper else CAPS.get(gid, CAN_ALL)
+    if mask & cap:
+        if helper:
+            HELPER_CAPS[(gid, bot_id)] = mask & ~cap
+        else:
+            CAPS[gid] = mask & ~cap
+        log.info("🔑 Bot can't %s in %s — skipping it for that until the next probe", CAP_NAMES[cap], gid,
+                 extra={"group": gid})
+
+
+def shard_can(gid, cap: int) -> bool:
+    """Like can(), for whichever bot bot_for() picks in this group."""
+    bot_id = SHARDS.get(gid)
+    if bot_id is None:
+        return can(gid, cap)
+    mask = HELPER_CAPS.get((gid, bot_id))
+    return mask is None or bool(mask & cap)
+
+
+def split_capable(group_ids, cap: int, via_shards: bool = False):
+    """(groups to try, groups skipped). `via_shards`: the command sends through
+    bot_for(), so helper shards are checked against their own rights."""
+    ok, skipped = [], []
+    for gid in group_ids:
+        if shard_can(gid, cap) if via_shards else can(gid, cap):
+            ok.append(gid)
+        else:
+            skipped.append(gid)
+    return ok, skipped
+
+
+async def report_skipped(update: Update, skipped, cap: int):
+    if not skipped:
+        return
+    sample = ", ".join(f"`{gid}`" for gid in skipped[:10])
+    more = f" (+{len(skipped) - 10} more)" if len(skipped) > 10 else ""
+    await update.message.reply_text(
+        f"⚠️ Skipping {len(skipped)} groups — bot can't {CAP_NAMES[cap]} there: {sample}{more}",
+        parse_mode="Markdown",
+    )
+
+
+async def probe_rights(bot) -> dict:
+    """get_chat_member for the bot in every active group, concurrently, into CAPS."""
+
+    async def probe(gid):
+        member = await tg_call(bot.get_chat_member, dead_letter=False, chat_id=gid, user_id=bot.id)
+        CAPS[gid] = caps_from_member(member)
+        return CAPS[gid]
+
+    results = await fan_out(REGISTRY.active(), probe, label="rights_probe")
+    missing = ", ".join(f"{name}: {sum(1 for m in CAPS.values() if not m & cap)}" for cap, _, name in CAP_FIELDS)
+    log.info("🔑 Rights probed in %d/%d groups; lacking — %s", count_ok(results), len(results), missing)
+    return results
+
+
+async def startup_probes(primary):
+    """Background at startup: shard assignment first, then the rights cache."""
+    await probe_shards(primary)
+    await probe_rights(primary)
+
+
+# =====================================================
+# 🧷 RUN CHECKPOINTS (resume after restart)
+# =====================================================
+# Har copy fan-out (broadcast / pin / auto job) ka ek `runs` row: targets + har group ka
+# 1 bit "ho gaya". Restart ke baad sirf bache hue groups ko bheja jata hai — duplicate nahi.
+
+CHECKPOINT_EVERY = 1.0  # seconds; after a crash at most this much progress is re-sent
+
+
+class RunCheckpoint:
+    """Targets of one fan-out plus a bitmap of the groups already handled.
+
+    The bitmap (one bit per target, ~1.3 KB for 10k groups) is rewritten at
+    most every CHECKPOINT_EVERY seconds through the Store writer.
+    """
+
+    def __init__(self, run_id, label, kind, payload, targets, done=None, notify_chat=None, started=None):
+        self.run_id = run_id
+        self.label = label
+        self.kind = kind
+        self.payload = payload
+        self.targets = targets
+        self.index = {gid: i for i, gid in enumerate(targets)}
+        self.done = bytearray(done) if done else bytearray((len(targets) + 7) // 8)
+        self.notify_chat = notify_chat
+        self.started = started
+        self.flusher = None  # pending loop.call_later handle while dirty
+
+    @classmethod
+    def create(cls, label, kind, targets, payload, notify_chat=None) -> "RunCheckpoint":
+        run = cls(uuid.uuid4().hex[:12], label, kind, payload, list(targets),
+                  notify_chat=notify_chat, started=get_ist_now().isoformat())
+        STORE.execute(
+            "INSERT INTO runs (run_id, label, kind, payload, targets, done, notify_chat, started)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run.run_id, label, kind, json.dumps(payload), json.dumps(run.targets), bytes(run.done),
+             notify_chat, run.started),
+        )
+        RUNS[run.run_id] = run
+        return run
+
+    def mark(self, gid):
+        i = self.index.get(gid)
+        if i is None:
+            return
+        self.done[i >> 3] |= 1 << (i & 7)
+        if self.flusher is None:
+            self.flusher = asyncio.get_running_loop().call_later(CHECKPOINT_EVERY, self.flush)
+
+    def remaining(self) -> list:
+        return [gid for gid, i in self.index.items() if not self.done[i >> 3] & (1 << (i & 7))]
+
+    def flush(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+            if STORE is not None:
+                STORE.execute("UPDATE runs SET done = ? WHERE run_id = ?", (bytes(self.done), self.run_id))
+            LEDGER.save(self.run_id)
+
+    def discard(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        RUNS.pop(self.run_id, None)
+        if STORE is not None:
+            STORE.execute("DELETE FROM runs WHERE run_id = ?", (self.run_id,))
+
+
+RUNS = {}  # run_id -> RunCheckpoint of fan-outs not finished yet
+
+
+async def resume_runs(application: Application):
+    """Startup: continue every run a restart interrupted, skipping groups already done."""
+    for run in list(RUNS.values()):
+        remaining = [gid for gid in run.remaining() if gid in REGISTRY]
+        if not remaining:
+            run.discard()
+            continue
+        skipped = len(run.targets) - len(remaining)
+        log.info("♻️ Resuming %s: %d left, %d already done", run.label, len(remaining), skipped,
+                 extra={"run": run.run_id, "job": run.label})
+
+        async def work(op, run=run, remaining=remaining):
+            is_job = run.label in config["jobs"]
+            if is_job:
+                CAMPAIGNS_RUNNING[run.label] = time.monotonic()
+            try:
+                return await dispatch(application.bot, run.kind, remaining, run.label, op=op, run=run, **run.payload)
+            finally:
+                if is_job:
+                    CAMPAIGNS_RUNNING.pop(run.label, None)
+
+        def finish(results, run=run, skipped=skipped):
+            record = config["jobs"].get(run.label)
+            if record is not None:
+                record["last_status"] = f"resumed:{count_ok(results)}/{len(results)}"
+                save(f"jobs.{run.label}")
+            return (
+                f"♻️ {run.label} resumed after restart: sent to {count_ok(results)} more groups "
+                f"({skipped} were done before)." + failed_note(results)
+            )
+
+        launch(application.bot, run.notify_chat, f"{run.label} (resumed)", len(remaining), work, finish)
+
+
+# =====================================================
+# 📒 DELIVERY LEDGER (/recall + targeted unpin)
+# =====================================================
+# Har run ne kis group mein kaunsa message_id banaya — do parallel arrays mein
+# (8 + 4 bytes per group), SQLite mein blob. Sirf newest LEDGER_RUNS runs rakhe jate hain.
+
+LEDGER_RUNS = int(os.getenv("LEDGER_RUNS", "50"))
+RECALL_BATCH = 100  # delete_messages takes at most 100 ids per call
+
+
+class LedgerRun:
+    __slots__ = ("run_id", "label", "kind", "started", "chats", "messages")
+
+    def __init__(self, run_id, label, kind, started, chats=b"", messages=b""):
+        self.run_id = run_id
+        self.label = label
+        self.kind = kind
+        self.started = started
+        self.chats = array("q", chats)      # group ids
+        self.messages = array("i", messages)  # our message id in that group (int32 in the API)
+
+    def describe(self) -> str:
+        return f"`{self.run_id}` `{self.label}` • {self.started[:16].replace('T', ' ')} • {len(self.chats)} groups"
+
+
+class DeliveryLedger:
+    """Message ids of recent fan-outs, for /recall and for unpinning only our own pin."""
+
+    def __init__(self):
+        self.runs = {}  # run_id -> LedgerRun, oldest first
+        self.pins = {}  # gid -> message id of the last message we pinned there
+
+    def load(self, runs, pins):
+        for run_id, label, kind, started, chats, messages in runs:
+            self.runs[run_id] = LedgerRun(run_id, label, kind, started, chats, messages)
+        self.pins.update(pins)
+        self._trim()
+
+    def record(self, run_id, label, kind, gid, message_id):
+        entry = self.runs.get(run_id)
+        if entry is None:
+            entry = self.runs[run_id] = LedgerRun(run_id, label, kind, get_ist_now().isoformat())
+            self._trim()
+        entry.chats.append(gid)
+        entry.messages.append(message_id)
+        if kind == "copy_pin":
+            self.pins[gid] = message_id
+            if STORE is not None:
+                STORE.execute("INSERT OR REPLACE INTO pins (chat_id, message_id) VALUES (?, ?)", (gid, message_id))
+
+    def save(self, run_id):
+        entry = self.runs.get(run_id)
+        if entry is not None and STORE is not None:
+            STORE.execute(
+                "INSERT OR REPLACE INTO ledger (run_id, label, kind, started, chats, messages) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, entry.label, entry.kind, entry.started, entry.chats.tobytes(), entry.messages.tobytes()),
+            )
+
+    def _trim(self):
+        while len(self.runs) > LEDGER_RUNS:
+            self.forget(next(iter(self.runs)))
+
+    def forget(self, run_id):
+        self.runs.pop(run_id, None)
+        if STORE is not None:
+            STORE.execute("DELETE FROM ledger WHERE run_id = ?", (run_id,))
+
+    def find(self, key: str):
+        """Run by id (or a unique id prefix), else the newest run with that label."""
+        if key in self.runs:
+            return self.runs[key]
+        matches = [entry for run_id, entry in self.runs.items() if run_id.startswith(key)]
+        if len(key) >= 4 and len(matches) == 1:
+            return matches[0]
+        for entry in reversed(self.runs.values()):
+            if entry.label == key:
+                return entry
+        return None
+
+    def recalled(self, entry: LedgerRun, gids):
+        """Drop deleted messages; a run is forgotten once nothing of it is left."""
+        gids = set(gids)
+        keep = [i for i, gid in enumerate(entry.chats) if gid not in gids]
+        for i, gid in enumerate(entry.chats):
+            if gid in gids and self.pins.get(gid) == entry.messages[i]:
+                self.unpinned(gid)
+        if not keep:
+            self.forget(entry.run_id)
+            return
+        entry.chats = array("q", (entry.chats[i] for i in keep))
+        entry.messages = array("i", (entry.messages[i] for i in keep))
+        self.save(entry.run_id)
+
+    def unpinned(self, gid):
+        if self.pins.pop(gid, None) is not None and STORE is not None:
+            STORE.execute("DELETE FROM pins WHERE chat_id = ?", (gid,))
+
+
+LEDGER = DeliveryLedger()
+
+
+# =====================================================
+# 📬 SEND QUEUE + WORKER PROCESSES
+# =====================================================
+# SEND_WORKERS=N: broadcast/pin/auto jobs ke sends SQLite `outbox` table mein queue hote hain
+# aur N alag processes unhe bhejte hain. Bot process sirf updates handle karta hai, to bade
+# fan-out ke dauran bhi monitor_changes aur spam delete turant chalte hain.
+# SEND_WORKERS=0 (default): sab kuch pehle ki tarah isi process mein fan_out se.
+
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "0"))
+QUEUE_POLL = 0.25      # seconds between outbox checks (workers and waiting handlers)
+SHARDS_RELOAD = 60     # workers re-read the shards table this often
+
+
+async def send_copy(bot, gid, from_chat_id, message_id):
+    _, msg = await copy_to(gid, bot, from_chat_id, message_id)
+    return msg
+
+
+async def send_copy_pin(bot, gid, from_chat_id, message_id):
+    shard_bot, msg = await copy_to(gid, bot, from_chat_id, message_id)
+    await tg_call(shard_bot.pin_chat_message, chat_id=gid, message_id=msg.message_id)
+    return msg
+
+
+# Queue "kind" -> sender; payload keys are passed as keyword arguments
+SENDERS = {"copy": send_copy, "copy_pin": send_copy_pin}
+
+
+class QueuedSendError(Exception):
+    """A send that failed inside a worker process (text of the original error)."""
+
+
+class Outbox:
+    """Durable send queue in the bot's SQLite file, shared by the bot and its workers.
+
+    Every row gets a lane (chat id modulo SEND_WORKERS) and each worker drains
+    only its own lane, so a group is always sent by the same process and the
+    per-group limits keep holding across processes. Methods are blocking —
+    call them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, path: str, lanes: int):
+        self.lanes = max(1, lanes)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def recover(self) -> list:
+        """Bot startup: empty the queue, returning (batch, chat_id) of rows that did finish.
+
+        Batch IDs are run IDs, so the caller marks those groups in their
+        checkpoints; everything else is re-submitted when the run resumes.
+        """
+        with self.lock, self.conn:
+            finished = self.conn.execute(
+                "SELECT batch, chat_id FROM outbox WHERE status IN ('done', 'failed')"
+            ).fetchall()
+            self.conn.execute("DELETE FROM outbox")
+            self.conn.execute("DELETE FROM outbox_metrics")  # previous process's metrics are gone too
+        return finished
+
+    def recover_lane(self, lane: int):
+        """A worker died: hand its in-flight rows to the replacement (at-least-once)."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE outbox SET status = 'queued' WHERE lane = ? AND status = 'sending'", (lane,))
+
+    def submit(self, batch: str, kind: str, group_ids, payload: dict):
+        data = json.dumps(payload)
+        rows = [(batch, abs(gid) % self.lanes, kind, gid, data) for gid in group_ids]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (batch, lane, kind, chat_id, payload) VALUES (?, ?, ?, ?, ?)", rows
+            )
 
+    def cancel(self, batch: str):
+        """Drop rows no worker has claimed yet; claimed ones still finish."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM outbox WHERE batch = ? AND status = 'queued'", (batch,))
+
+    def collect(self, batch: str):
+        """(chat_id, status, result) of the batch's finished rows so far, plus the
+        workers' metric deltas (any batch); both are removed."""
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, chat_id, status, result FROM outbox WHERE batch = ? AND status IN ('done', 'failed')",
+                (batch,),
+            ).fetchall()
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row in rows])
+            metrics = self.conn.execute("SELECT id, data FROM outbox_metrics").fetchall()
+            if metrics:
+                self.conn.execute("DELETE FROM outbox_metrics WHERE id <= ?", (metrics[-1][0],))
+        return [row[1:] for row in rows], [json.loads(data) for _, data in metrics]
+
+    def claim(self, lane: int, limit: int) -> list:
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, kind, chat_id, payload FROM outbox WHERE lane = ? AND status = 'queued' ORDER BY id LIMIT ?",
+                (lane, limit),
+            ).fetchall()
+            self.conn.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?", [(row[0],) for row in rows])
+        return rows
+
+    def finish(self, updates, metrics: dict = None):
+        """updates: (status, result JSON, row id) tuples, written in one transaction
+        with the worker's metric deltas (see take_metric_deltas)."""
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE outbox SET status = ?, result = ? WHERE id = ?", updates)
+            if metrics:
+                self.conn.execute("INSERT INTO outbox_metrics (data) VALUES (?)", (json.dumps(metrics),))
+
+    def shards(self) -> list:
+        with self.lock:
+            return self.conn.execute("SELECT chat_id, bot_id FROM shards").fetchall()
+
+
+OUTBOX = None  # opened in serve() when SEND_WORKERS > 0
+
+
+async def dispatch(bot, kind: str, group_ids, label: str, offsets: dict = None, op: Operation = None,
+                   run: "RunCheckpoint" = None, notify_chat=None, **payload) -> dict:
+    """Fan `SENDERS[kind]` out over the groups — in this process, or via the outbox.
+
+    `offsets` ({gid: seconds}, see plan_offsets) holds each group back until
+    that long after the start; groups are released in offset order. `op`
+    gets live sent/failed counts. Progress is checkpointed (see RunCheckpoint)
+    so a restart resumes the run instead of starting over; pass `run` to
+    continue an existing checkpoint, `notify_chat` for the resume notice.
+    Returns {gid: result or Exception} like `fan_out`; queued failures come back
+    as QueuedSendError and are added to DEAD_LETTERS here, in the bot process.
+    """
+    group_ids = list(group_ids)
+    start = time.monotonic()
+    if run is None and STORE is not None:
+        run = RunCheckpoint.create(label, kind, group_ids, payload, notify_chat)
+    run_id = run.run_id if run else uuid.uuid4().hex[:12]
+    if offsets:
+        group_ids.sort(key=offsets.__getitem__)
+
+    def finished(gid, result):
+        if op is not None:
+            op.record(gid, result)
+        if OUTBOX is not None:
+            BREAKER.record(gid, result)  # in-process sends are recorded by fan_out
+        if not isinstance(result, Exception):
+            # in-process senders return the Message, queued ones just its id
+            LEDGER.record(run_id, label, kind, gid, getattr(result, "message_id", result))
+        if run is not None:
+            run.mark(gid)
 
-# =====================================================
-# 🧩 MANUAL GROUP IDS (ADD ALL GROUP IDS HERE)
-# =====================================================
+    try:
+        if OUTBOX is None:
+            sender = SENDERS[kind]
 
-GROUP_IDS = [-1002236012208, -1002417345407, -1002330831798, -1001882254820, -1002295951659, -1002350372764, -1002408686476, -1002458796542, -1002459378218, -1001787331133, -1001797945922, -1001843610820, -1002052681893, -1002126246859, -1001509387207, -1001738062150, -1001587346978, -1001829615017, -1002083172621, -1002411884866, -1001567747819, -1002254648501, -1003366623406, -1002283304339, -4557532425, -1001637428890, -1002299671203, -1002568461287, -1002538473462]
+            async def send(gid):
+                if offsets:
+                    await asyncio.sleep(start + offsets[gid] - time.monotonic())
+                return await sender(bot, gid, **payload)
 
-# =====================================================
-# ⚙️ AUTO BROADCAST SETTINGS (IN-MEMORY, NO JSON)
+            results = await fan_out(group_ids, send, label=label, on_result=finished)
+        else:
+            group_ids, skipped = BREAKER.split(group_ids)
+            quarantined = {gid: Quarantined(gid) for gid in skipped}
+            for gid, result in quarantined.items():
+                finished(gid, result)
+            results = await submit_and_wait(bot, run_id, kind, group_ids, offsets, payload, finished)
+            results.update(quarantined)
+            record_fanout(label, results, time.monotonic() - start)
+    except asyncio.CancelledError:
+        LEDGER.save(run_id)  # what did go out can still be recalled
+        if run is not None:
+            if op is not None and op.suspended:
+                run.flush()    # shutting down: keep the checkpoint, resume after restart
+            else:
+                run.discard()  # /cancel: the admin wants it stopped for good
+        raise
+    LEDGER.save(run_id)
+    if run is not None:
+        run.discard()
+    return results
+
+
+async def submit_and_wait(bot, batch, kind, group_ids, offsets, payload, finished) -> dict:
+    results = {}
+    released = 0
+    start = time.monotonic()
+    try:
+        while len(results) < len(group_ids):
+            # Offsets: rows enter the outbox only when their slot comes up
+            elapsed = time.monotonic() - start
+            end = released
+            while end < len(group_ids) and (not offsets or offsets[group_ids[end]] <= elapsed):
+                end += 1
+            if end > released:
+                await asyncio.to_thread(OUTBOX.submit, batch, kind, group_ids[released:end], payload)
+                released = end
+
+            rows, metrics = await asyncio.to_thread(OUTBOX.collect, batch)
+            for deltas in metrics:
+                merge_metric_deltas(deltas)
+            for gid, state, result in rows:
+                result = json.loads(result) if result else None
+                if state == "done":
+                    results[gid] = result
+                else:
+                    results[gid] = QueuedSendError(result["error"])
+                    if result["error"].startswith("Forbidden") and gid in REGISTRY:
+                        REGISTRY.set_status(gid, "left")
+                    if result.get("method"):
+                        result["bot"] = BOTS.get(result.pop("bot_id"), bot)
+                        DEAD_LETTERS.append(result)
+                finished(gid, results[gid])
+
+            wait = QUEUE_POLL
+            if released < len(group_ids) and offsets:
+                wait = min(wait, offsets[group_ids[released]] - elapsed)
+            await asyncio.sleep(wait)
+    except asyncio.CancelledError:
+        OUTBOX.cancel(batch)  # rows not picked up yet are dropped; in-flight ones finish
+        raise
+    return results
+
+
+def send_worker(lane: int, lanes: int, stop):
+    """Entry point of a send worker process (multiprocessing target)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C goes to the bot process; it sets `stop`
+    setup_logging()
+    try:
+        asyncio.run(drain_outbox(lane, lanes, stop))
+    finally:
+        stop_logging()
+
+
+async def drain_outbox(lane: int, lanes: int, stop):
+    global GLOBAL_RATE, OUTBOX
+    GLOBAL_RATE /= lanes + 1  # workers + the bot process share each token's ~30/s budget
+    OUTBOX = Outbox(DB_PATH, lanes)
+    bots = [make_bot(token) for token in [TOKEN, *EXTRA_TOKENS]]
+    for bot in bots:
+        await bot.initialize()
+        BOTS[bot.id] = bot
+    primary = bots[0]
+    log.info("📬 Send worker %d/%d started", lane + 1, lanes)
+
+    # Rows are claimed as slots free up (not in lock-step chunks), so one slow group only
+    # holds its own slot; per-shard pools since every token has its own rate budget
+    capacity = FANOUT_CONCURRENCY * 4 * len(bots)
+    pools = {}
+    tasks = set()
+    updates = []
+
+    async def send(row):
+        row_id, kind, gid, payload = row
+        async with pools.setdefault(SHARDS.get(gid), asyncio.Semaphore(FANOUT_CONCURRENCY)):
+            try:
+                msg = await SENDERS[kind](primary, gid, **json.loads(payload))
+            except Exception as e:
+                letter = dict(getattr(e, "dead_letter", None) or {"error": f"{type(e).__name__}: {e}"})
+                if "bot" in letter:
+                    letter["bot_id"] = letter.pop("bot").id
+                updates.append(("failed", json.dumps(letter), row_id))
+            else:
+                updates.append(("done", json.dumps(msg.message_id), row_id))
+
+    shards_loaded = 0.0
+    while tasks or not stop.is_set():  # on stop: no new claims, in-flight rows still finish
+        if time.monotonic() - shards_loaded > SHARDS_RELOAD:
+            SHARDS.clear()
+            SHARDS.update(await asyncio.to_thread(OUTBOX.shards))
+            shards_loaded = time.monotonic()
+
+        if not stop.is_set() and len(tasks) < capacity:
+            rows = await asyncio.to_thread(OUTBOX.claim, lane, capacity - len(tasks))
+            tasks.update(asyncio.ensure_future(send(row)) for row in rows)
+        if tasks:
+            _, tasks = await asyncio.wait(tasks, timeout=QUEUE_POLL)
+        else:
+            await asyncio.sleep(QUEUE_POLL)
 
-# Per-job storage template: jobs are keyed `job_1`..`job_5`.
-# Each job stores scheduling info and one source message.
-# time: "HH:MM" string in IST when the job should run daily.
-# from_chat_id/message_id: source message copied on each run.
-# is_active: whether the job is enabled.
-# last_run/next_run/last_status for diagnostics.
-# =====================================================
-# ⚙️ AUTO BROADCAST & ANTI-CHANGE SETTINGS
-# =====================================================
+        # Rows are marked as they finish so the bot's run checkpoint keeps up
+        ready = updates[:]
+        del updates[:len(ready)]
+        if ready:
+            await asyncio.to_thread(OUTBOX.finish, ready, take_metric_deltas())
+        DEAD_LETTERS.clear()  # the bot process keeps the real list (see dispatch)
 
-config = {
-    "night_start": 23,
-    "night_end": 7,
-    "is_active": False,
-    "blacklist": [],
-    "whitelist": [],
-    "locked_details": {
-        "name": None,
-        "desc": None,
-        "pic_file_id": None,
-        "groups": {} 
-    }
-}
+    for bot in bots:
+        await bot.shutdown()
 
-JOB_COUNT = 10
-config.setdefault("jobs", {})
-for i in range(1, JOB_COUNT + 1):
-    name = f"job_{i}"
-    config["jobs"].setdefault(name, {
-        "time": None,
-        "from_chat_id": None,
-        "message_id": None,
-        "is_active": False,
-        "last_run": None,
-        "next_run": None,
-        "last_status": "stopped",
-        "target_group": None 
-    })
 
 # =====================================================
 # Time helpers (IST)
@@ -113,112 +1973,667 @@ def format_time_12h(hhmm: str) -> str:
     return f"{hour:02d}:{mm:02d} {suffix}"
 
 
-def schedule_daily_job(context, job_name: str, hh: int, mm: int):
-    """Schedule `auto_broadcast_job` to run every day at HH:MM IST.
+# =====================================================
+# ⏰ CAMPAIGN SCHEDULER
+# =====================================================
+# Saare broadcast jobs ek hi heap mein (next fire time, seq, name) — ek asyncio task sirf
+# sabse pehle wale tak sota hai. Add O(log n), cancel O(1) (entry mark hoti hai, pop par skip).
+# Specs: "08:30" (daily), "every 45m" / "every 2h", "cron 30 8 * * 1-5"; har job ka apna tz.
+
+DEFAULT_TZ = os.getenv("BOT_TZ", "Asia/Kolkata")
+INTERVAL_FIRST_RUN = 10  # seconds until the first run of a new interval job
+
+
+class IntervalSchedule:
+    def __init__(self, seconds: int):
+        if seconds <= 0:
+            raise ValueError("interval must be positive")
+        self.seconds = seconds
+
+    def first(self, now: float) -> float:
+        return now + INTERVAL_FIRST_RUN
+
+    def next_after(self, fired: float, now: float) -> float:
+        nxt = fired + self.seconds
+        if nxt <= now:  # loop was late (sleep / long GC): skip missed slots, don't burst
+            nxt += (now - nxt) // self.seconds * self.seconds + self.seconds
+        return nxt
+
+
+class CronSchedule:
+    """Five-field cron (minute hour day-of-month month day-of-week) in the job's time zone."""
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))  # day-of-week: 0 and 7 = Sunday
+
+    def __init__(self, expr: str, tz: ZoneInfo):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError("cron needs 5 fields")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._field(part, lo, hi) for part, (lo, hi) in zip(parts, self.FIELDS)
+        )
+        # Classic cron: agar day-of-month aur day-of-week dono restricted hain to dono mein se koi bhi chalega
+        self.any_day = parts[2] == "*" or parts[4] == "*"
+        self.tz = tz
+
+    @staticmethod
+    def _field(part: str, lo: int, hi: int) -> frozenset:
+        values = set()
+        for item in part.split(","):
+            rng, _, step = item.partition("/")
+            if rng == "*":
+                start, end = lo, hi
+            elif "-" in rng:
+                start, end = map(int, rng.split("-"))
+            else:
+                start = int(rng)
+                end = hi if step else start  # "5/10" = 5,15,25,... like standard cron
+            if not (lo <= start <= end <= hi):
+                raise ValueError(f"{item!r} out of range {lo}-{hi}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        if hi == 7:
+            values = {v % 7 for v in values}
+        return frozenset(values)
+
+    def _day_matches(self, day: datetime) -> bool:
+        dom = day.day in self.days
+        dow = (day.weekday() + 1) % 7 in self.weekdays  # cron: 0 = Sunday
+        return (dom and dow) if self.any_day else (dom or dow)
+
+    def first(self, now: float) -> float:
+        return self.next_after(now, now)
+
+    def next_after(self, fired: float, now: float) -> float:
+        # Wall-clock fields, so step through local (naive) time and localise the result
+        t = datetime.fromtimestamp(max(fired, now), self.tz).replace(tzinfo=None, second=0, microsecond=0)
+        t += timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t.replace(tzinfo=self.tz).timestamp()
+        raise ValueError("cron expression never fires")
+
+
+def parse_schedule(spec: str, tz_name: str = None):
+    """Record "time" string -> schedule. Raises ValueError for a bad spec or zone."""
+    try:
+        tz = ZoneInfo(tz_name or DEFAULT_TZ)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown time zone {tz_name!r}")
+    spec = spec.strip()
+    if spec.startswith("cron "):
+        return CronSchedule(spec[5:], tz)
+    if ":" in spec:
+        hh, mm = map(int, spec.split(":"))
+        return CronSchedule(f"{mm} {hh} * * *", tz)
+    amount = spec.replace("every", "").strip()
+    unit = 3600 if amount.endswith("h") else 60
+    return IntervalSchedule(int(amount.rstrip("mh")) * unit)
+
+
+def describe_schedule(rec: dict) -> str:
+    spec = rec.get("time") or "?"
+    tz = rec.get("tz") or DEFAULT_TZ
+    if spec == "?":
+        return "Not Set"
+    if spec.startswith("every"):
+        return spec
+    if spec.startswith("cron "):
+        return f"`{spec}` (`{tz}`)"
+    return f"{format_time_12h(spec)} daily (`{tz}`)"
+
+
+class Scheduler:
+    """Single-timer heap of campaign fire times; any number of named jobs."""
+
+    def __init__(self):
+        self.heap = []       # [fire_at, seq, name]; name None = cancelled
+        self.entries = {}    # name -> live heap entry
+        self.schedules = {}  # name -> IntervalSchedule / CronSchedule
+        self.seq = itertools.count()
+        self.wake = asyncio.Event()
+        self.callback = None  # async callback(name), set by start()
+        self.task = None
+        self.running = set()  # fired callbacks still in progress (keeps a reference)
+        self.recent = deque(maxlen=256)  # (fire_at, name) of the latest fires, for the planner
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name) -> bool:
+        return name in self.entries
+
+    def add(self, name: str, schedule):
+        """(Re)schedule `name`; replaces any existing timer of that name."""
+        self.cancel(name)
+        self.schedules[name] = schedule
+        self._push(name, schedule.first(time.time()))
+
+    def _push(self, name, fire_at: float):
+        entry = [fire_at, next(self.seq), name]
+        self.entries[name] = entry
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.wake.set()  # new earliest job — runner must re-arm its sleep
+
+    def cancel(self, name: str) -> bool:
+        entry = self.entries.pop(name, None)
+        self.schedules.pop(name, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.entries):
+            # Mostly tombstones: rebuild so memory tracks live jobs
+            self.heap = [e for e in self.heap if e[2] is not None]
+            heapq.heapify(self.heap)
+        return True
+
+    def clear(self) -> int:
+        count = len(self.entries)
+        for entry in self.entries.values():
+            entry[2] = None
+        self.heap, self.entries, self.schedules = [], {}, {}
+        return count
+
+    def next_run(self, name: str):
+        entry = self.entries.get(name)
+        return entry[0] if entry else None
+
+    def fires_between(self, start: float, end: float) -> list:
+        """Names of jobs due in [start, end]; walks only heap nodes <= end, O(matches)."""
+        found, stack = [], [0] if self.heap else []
+        while stack:
+            i = stack.pop()
+            fire_at, _, name = self.heap[i]
+            if fire_at > end:
+                continue  # heap property: the whole subtree is later
+            if name is not None and fire_at >= start:
+                found.append(name)
+            stack.extend(child for child in (2 * i + 1, 2 * i + 2) if child < len(self.heap))
+        return found
+
+    def upcoming(self, limit: int) -> list:
+        """[(fire_at, name)] soonest first — O(n log limit), no full sort."""
+        live = (entry for entry in self.heap if entry[2] is not None)
+        return [(e[0], e[2]) for e in heapq.nsmallest(limit, live)]
+
+    def start(self, callback):
+        self.callback = callback
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            while self.heap and self.heap[0][2] is None:
+                heapq.heappop(self.heap)
+            delay = self.heap[0][0] - time.time() if self.heap else None
+            if delay is None or delay > 0:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            fire_at, _, name = heapq.heappop(self.heap)
+            del self.entries[name]
+            self.recent.append((fire_at, name))
+            self._push(name, self.schedules[name].next_after(fire_at, time.time()))
+            task = asyncio.create_task(self.callback(name))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+
+SCHEDULER = Scheduler()
+
+
+def schedule_from_record(job_name: str, rec: dict):
+    """(Re)arm the timer for a stored job record; raises ValueError for a bad spec."""
+    SCHEDULER.add(job_name, parse_schedule(rec["time"], rec.get("tz")))
+    rec["next_run"] = fire_time_iso(SCHEDULER.next_run(job_name), rec)
+
+
+def fire_time_iso(fire_at, rec: dict):
+    if fire_at is None:
+        return None
+    return datetime.fromtimestamp(fire_at, ZoneInfo(rec.get("tz") or DEFAULT_TZ)).isoformat()
+
+
+def job_ready(rec: dict) -> bool:
+    return bool(rec.get("time") and rec.get("from_chat_id") and rec.get("message_id"))
+
+
+async def restore_jobs(application: Application):
+    """Startup hook: bring back every job that was active before the restart
+    and start the background refreshers."""
+    restored = []
+    for name, rec in config["jobs"].items():
+        if rec.get("is_active") and job_ready(rec):
+            try:
+                schedule_from_record(name, rec)
+                restored.append(name)
+            except ValueError as e:
+                log.error("Error restoring %s: %s", name, e, extra={"job": name})
+    SCHEDULER.start(functools.partial(timed(auto_broadcast_job), application))
+    DEFERRED.start(application.bot)
+    BREAKER.start(application.bot)
+    await resume_runs(application)
+    log.info("♻️ Restored %d jobs: %s%s", len(restored), ', '.join(restored[:20]) or '-', ' ...' if len(restored) > 20 else '')
+
+    # /info + /stats ke liye group metadata background mein warm rakho
+    application.job_queue.run_repeating(timed(chat_meta_job), interval=META_CYCLE, first=5, name="chat_meta_refresh")
+
+
+async def close_store(application: Application):
+    """Shutdown hook: flush pending writes."""
+    for run in list(RUNS.values()):
+        run.flush()
+    if STORE is not None:
+        STORE.close()
+
+# =====================================================
+# 🪞 CHAT STATE CACHE (locked vs observed details)
+# =====================================================
+# Har group ka last known title / description / photo yahan rehta hai.
+# Revert tabhi bhejte hain jab observed state locked state se alag ho.
+
+DESC_RECHECK_SECONDS = 600  # cached description kitni der tak trusted hai
+REVERT_DEBOUNCE = 2.0       # ek group ke events ka burst itni der mein merge hota hai
+
+
+class ChatState:
+    __slots__ = ("title", "description", "desc_checked", "photo_uid", "photo_dirty", "pending")
+
+    def __init__(self):
+        self.title = None          # from new_chat_title events and our own set_chat_title
+        self.description = None    # from get_chat / our own set_chat_description
+        self.desc_checked = 0.0    # monotonic time of the last description read/write
+        self.photo_uid = None      # file_unique_id of the photo we set last
+        self.photo_dirty = False   # someone else changed the photo since then
+        self.pending = None        # debounced revert task
+
+
+CHAT_STATE = {}
+
+
+def chat_state(gid) -> ChatState:
+    state = CHAT_STATE.get(gid)
+    if state is None:
+        state = CHAT_STATE[gid] = ChatState()
+    return state
+
+
+def desired_title(gid):
+    """Locked title for a group: specific override, else the numbered /setgname title."""
+    ld = config.get("locked_details", {})
+    specific = ld.get("groups", {}).get(str(gid), {})
+    if specific.get("name"):
+        return specific["name"]
+    if ld.get("name") and gid in REGISTRY:
+        return f"{REGISTRY.serial(gid):02d}. {ld['name']}"
+    return ld.get("name")
+
+
+async def revert_drift(bot, gid):
+    """Debounced revert: compare cached state with the locked details and fix only the diff."""
+    await asyncio.sleep(REVERT_DEBOUNCE)
+    state = chat_state(gid)
+    state.pending = None  # events from here on schedule a fresh pass
+
+    ld = config.get("locked_details", {})
+    target_name = desired_title(gid)
+    target_desc = ld.get("desc")
+    target_pic = ld.get("pic_file_id")
+
+    try:
+        # Revert Name
+        if target_name and state.title is not None and state.title != target_name:
+            await tg_call(bot.set_chat_title, dead_letter=False, chat_id=gid, title=target_name)
+            state.title = target_name
+
+        # Revert Photo
+        if state.photo_dirty and target_pic:
+            photo = await locked_photo_bytes(bot)
+            await tg_call(bot.set_chat_photo, dead_letter=False, chat_id=gid, photo=photo)
+        state.photo_dirty = False
+
+        # Description change ka signal nahi milta — cached copy stale ho to hi get_chat karo
+        if target_desc:
+            now = time.monotonic()
+            if state.description is None or now - state.desc_checked > DESC_RECHECK_SECONDS:
+                chat = await tg_call(bot.get_chat, dead_letter=False, chat_id=gid)
+                state.description = chat.description or ""
+                state.desc_checked = now
+            if state.description != target_desc:
+                await tg_call(bot.set_chat_description, dead_letter=False, chat_id=gid, description=target_desc)
+                state.description = target_desc
+                state.desc_checked = now
+
+    except Exception as e:
+        log.error("❌ Monitor Error in %s: %s", gid, e, extra={"group": gid, "sample": "monitor_error"})
 
-    We compute the delay from now (in IST) to the next occurrence and then
-    schedule a repeating job with an interval of 86400 seconds.
-    """
-    now = get_ist_now()
-    target = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
-    if target <= now:
-        target += timedelta(days=1)
-    first_delay = (target - now).total_seconds()
-    # remove any existing job with same name before scheduling
-    for j in context.application.job_queue.get_jobs_by_name(job_name):
-        j.schedule_removal()
-    context.application.job_queue.run_repeating(
-        auto_broadcast_job,
-        interval=86400,
-        first=first_delay,
-        name=job_name,
-    )
 
 async def monitor_changes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message: return
-    
-    # Bot ke apne actions ko ignore karein
-    if update.effective_user and update.effective_user.id == context.bot.id: 
-        return
-    
+    message = update.message
     chat = update.effective_chat
-    gid_str = str(chat.id)
-    
+    state = chat_state(chat.id)
+
+    # Bot ke apne actions: revert nahi, sirf cache update
+    if update.effective_user and update.effective_user.id == context.bot.id:
+        if message.new_chat_title:
+            state.title = message.new_chat_title
+        if message.new_chat_photo:
+            state.photo_uid = message.new_chat_photo[-1].file_unique_id
+            state.photo_dirty = False
+        return
+
     # 🚫 VIDEO CHAT BLOCKER
-    if update.message.video_chat_started or update.message.video_chat_scheduled:
-        if not is_admin(update):
+    if message.video_chat_started or message.video_chat_scheduled:
+        if not is_admin(update) and can(chat.id, CAN_DELETE):
             try:
-                await update.message.delete()
+                await message.delete()
                 await context.bot.send_message(chat_id=chat.id, text="⚠️ Unauthorized Meeting Stopped.")
                 return 
             except: pass
 
     # 🛡️ REVERT UNAUTHORIZED CHANGES
     if not is_admin(update):
-        ld = config.get("locked_details", {})
-        specific = ld.get("groups", {}).get(gid_str, {})
-        
-        target_name = specific.get("name") or ld.get("name")
-        target_desc = ld.get("desc")
-        target_pic = ld.get("pic_file_id")
-
-        try:
-            # Force Revert Name
-            if update.message.new_chat_title and target_name:
-                await context.bot.set_chat_title(chat_id=chat.id, title=target_name)
-            
-            # Force Revert Photo
-            if update.message.new_chat_photo and target_pic:
-                await context.bot.set_chat_photo(chat_id=chat.id, photo=target_pic)
-                
-            # Always Sync Description (Description change ka signal nahi milta, isliye har activity par sync)
-            if target_desc:
-                await context.bot.set_chat_description(chat_id=chat.id, description=target_desc)
+        if message.new_chat_title:
+            state.title = message.new_chat_title
+        if message.new_chat_photo and message.new_chat_photo[-1].file_unique_id != state.photo_uid:
+            state.photo_dirty = True
 
-        except Exception as e:
-            print(f"❌ Monitor Error in {gid_str}: {e}")
+        ld = config.get("locked_details", {})
+        title_drift = state.title is not None and state.title != desired_title(chat.id)
+        desc_unknown = ld.get("desc") and (
+            state.description != ld["desc"]
+            or time.monotonic() - state.desc_checked > DESC_RECHECK_SECONDS
+        )
+        if (title_drift or state.photo_dirty or desc_unknown) and state.pending is None and can(chat.id, CAN_CHANGE_INFO):
+            state.pending = context.application.create_task(
+                revert_drift(context.bot, chat.id), update=update
+            )
 
 # Developer notes — How to create new jobs
-# Option A — Use the built-in staggered auto jobs:
-#   set JOB_COUNT = N and use /autoon to create jobs named auto_broadcast_1..N
-# Option B — Create a custom job:
-#   define async def my_job(context): ... and schedule with:
+# Broadcast campaigns: /setjob <name> <spec> creates config['jobs'][name] and arms it in
+#   SCHEDULER (see parse_schedule for specs). There is no fixed number of slots.
+# Other periodic work (refreshers etc.) still uses the PTB job queue:
 #     telegram_app.job_queue.run_repeating(my_job, interval=..., first=..., name='my_job')
-#   remove with job.schedule_removal() or get by name via job_queue.get_jobs_by_name('my_job')
-#
-# Naming and tracking:
-# - Built-in jobs use names `auto_broadcast_<n>`; pick unique names for custom jobs.
-# - To track a custom job in `config['jobs']`, add an entry after scheduling.
 
 # =====================================================
 # 🛡 HELPERS
 
+class AccessLists(NamedTuple):
+    """Frozen snapshot of who may do what; swapped as a whole by refresh_acl()."""
+    privileged: frozenset  # ADMIN_IDS + whitelist
+    blacklist: frozenset
+
+
+ACL = AccessLists(privileged=frozenset(ADMIN_IDS), blacklist=frozenset())
+
+
+def refresh_acl():
+    """Rebuild the frozen sets — call after whitelist/blacklist change or config load."""
+    global ACL
+    ACL = AccessLists(
+        privileged=frozenset(ADMIN_IDS) | frozenset(config.get("whitelist", [])),
+        blacklist=frozenset(config.get("blacklist", [])),
+    )
+
+
 # Is function ko replace karein
 def is_admin(update: Update) -> bool:
-    user_id = update.effective_user.id
-    # Check if user is Main Admin (from ENV) OR Whitelisted
-    return user_id in ADMIN_IDS or user_id in config.get("whitelist", [])
+    # Main Admin (from ENV) OR Whitelisted — single set lookup
+    user = update.effective_user
+    return user is not None and user.id in ACL.privileged
 
 
-def night_mode() -> bool:
-    # Use IST for all night checks
-    ist = get_ist_now()
-    hour = ist.hour
-    ns = config["night_start"]
-    ne = config["night_end"]
+class BlacklistedSender(filters.MessageFilter):
+    """Passes only messages from blacklisted users.
+
+    Runs inside the dispatcher, so normal messages never create a handler coroutine.
+    """
+
+    def filter(self, message) -> bool:
+        return message.from_user is not None and message.from_user.id in ACL.blacklist
+
+
+class UnprivilegedSender(filters.MessageFilter):
+    """Passes messages not sent by admins/whitelisted users."""
 
+    def filter(self, message) -> bool:
+        return message.from_user is None or message.from_user.id not in ACL.privileged
+
+
+BLACKLISTED = BlacklistedSender(name="BlacklistedSender")
+UNPRIVILEGED = UnprivilegedSender(name="UnprivilegedSender")
+
+
+def in_window(hour: int, start: int, end: int) -> bool:
     # Disabled if both set to 0
-    if ns == 0 and ne == 0:
+    if start == 0 and end == 0:
         return False
 
-    if ns > ne:  # crosses midnight, e.g., 23 -> 7
-        return hour >= ns or hour < ne
+    if start > end:  # crosses midnight, e.g., 23 -> 7
+        return hour >= start or hour < end
     else:
-        return ns <= hour < ne
+        return start <= hour < end
+
+
+def night_mode() -> bool:
+    # Use IST for all night checks
+    return in_window(get_ist_now().hour, config["night_start"], config["night_end"])
+
+
+# =====================================================
+# 🌙 QUIET HOURS + DEFERRED QUEUE
+# =====================================================
+# Night mode ab run drop nahi karta: jo groups apne quiet window mein hain unka send
+# DEFERRED mein ruk jata hai aur window khatam hone par DEFER_SPREAD seconds mein
+# dheere dheere (rate limiter ke andar) nikalta hai. Group ka apna window na ho to
+# global night_start/night_end lagta hai.
+
+DEFER_SPREAD = float(os.getenv("DEFER_SPREAD", "600"))  # seconds a window's held sends are spread over
+QUIET_HOURS = {}  # gid -> (start, end); int-keyed mirror of config["quiet_hours"]
+
+
+def refresh_quiet():
+    """Rebuild QUIET_HOURS — call after quiet_hours change or config load."""
+    global QUIET_HOURS
+    QUIET_HOURS = {int(gid): tuple(window) for gid, window in config.get("quiet_hours", {}).items()}
+
+
+def quiet_window(gid) -> tuple:
+    return QUIET_HOURS.get(gid) or (config["night_start"], config["night_end"])
+
+
+def quiet_release(gid, now: datetime):
+    """Epoch time this group's quiet window ends, or None if it is awake at IST `now`."""
+    start, end = quiet_window(gid)
+    if not in_window(now.hour, start, end):
+        return None
+    until = now.replace(hour=end, minute=0, second=0, microsecond=0)
+    if until <= now:
+        until += timedelta(days=1)
+    # IST wall time -> epoch; exact, so every fire in one night lands on the same heap slot
+    return (until - timedelta(hours=5, minutes=30)).replace(tzinfo=timezone.utc).timestamp()
+
+
+class DeferredQueue:
+    """Sends held back by quiet hours, in a heap keyed by release time.
+
+    One entry per (label, group): a job that fires again during the night
+    replaces its held copy instead of stacking another one. Same tombstone
+    scheme as Scheduler; the runner only ever looks at the heap top.
+    """
+
+    def __init__(self):
+        self.heap = []     # [release_at, seq, key, kind, payload]; key None = replaced
+        self.entries = {}  # (label, gid) -> live heap entry
+        self.seq = itertools.count()
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def load(self, rows):
+        for label, gid, kind, payload, release_at in rows:
+            self._push((label, gid), release_at, kind, json.loads(payload))
+
+    def _push(self, key, release_at, kind, payload):
+        entry = [release_at, next(self.seq), key, kind, payload]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.wake.set()
+
+    def hold(self, label: str, gid, release_at: float, kind: str, payload: dict):
+        key = (label, gid)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == release_at:
+            entry[3], entry[4] = kind, payload  # newer content, same release slot
+        else:
+            if entry is not None:
+                entry[2] = None
+            self._push(key, release_at, kind, payload)
+        if STORE is not None:
+            STORE.execute(
+                "INSERT OR REPLACE INTO deferred (label, chat_id, kind, payload, release_at) VALUES (?, ?, ?, ?, ?)",
+                (label, gid, kind, json.dumps(payload), release_at),
+            )
+
+    def drop(self, label: str = None) -> int:
+        """Forget the held sends of one job (or all of them); returns how many."""
+        keys = [key for key in self.entries if label is None or key[0] == label]
+        for key in keys:
+            self.entries.pop(key)[2] = None
+        if keys and STORE is not None:
+            if label is None:
+                STORE.execute("DELETE FROM deferred")
+            else:
+                STORE.execute("DELETE FROM deferred WHERE label = ?", (label,))
+        self.wake.set()  # runner pops the tombstones off the top
+        return len(keys)
+
+    def next_release(self):
+        while self.heap and self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def due(self, now: float) -> list:
+        """Pop every live entry released by `now` as (label, gid, kind, payload)."""
+        out = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, key, kind, payload = heapq.heappop(self.heap)
+            if key is None:
+                continue
+            del self.entries[key]
+            out.append((*key, kind, payload))
+            if STORE is not None:
+                STORE.execute("DELETE FROM deferred WHERE label = ? AND chat_id = ?", key)
+        return out
+
+    def start(self, bot):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(bot))
+
+    async def _run(self, bot):
+        while True:
+            release_at = self.next_release()
+            delay = release_at - time.time() if release_at is not None else None
+            if delay is None or delay > 0:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            release_deferred(bot, self.due(time.time()))
+
+
+DEFERRED = DeferredQueue()
+
+
+def hold_quiet(label: str, group_ids, kind: str, payload: dict) -> set:
+    """Park the sends for groups inside their quiet window; returns the held gids."""
+    now = get_ist_now()
+    held = set()
+    for gid in group_ids:
+        release_at = quiet_release(gid, now)
+        if release_at is not None:
+            DEFERRED.hold(label, gid, release_at, kind, payload)
+            held.add(gid)
+    return held
+
+
+def release_deferred(bot, items):
+    """Window over: send the held items, one tracked run per (label, content)."""
+    batches = {}
+    for label, gid, kind, payload in items:
+        batches.setdefault((label, kind, json.dumps(payload, sort_keys=True)), []).append(gid)
+    for (label, kind, payload), group_ids in batches.items():
+        record = config["jobs"].get(label)
+        if record is None or not record.get("is_active"):
+            log.info("🌅 Dropping %d deferred %s sends — job stopped or deleted", len(group_ids), label,
+                     extra={"job": label})
+            continue
+        payload = json.loads(payload)
+        prefix = f"{label}:deferred:".encode()
+        offsets = {gid: zlib.crc32(prefix + str(gid).encode()) / 2**32 * DEFER_SPREAD for gid in group_ids}
+        log.info("🌅 Releasing %d deferred %s sends over %.0fs", len(group_ids), label, DEFER_SPREAD, extra={"job": label})
+
+        async def work(op, label=label, kind=kind, group_ids=group_ids, offsets=offsets, payload=payload):
+            return await dispatch(bot, kind, group_ids, label, offsets, op, **payload)
+
+        def finish(results, label=label):
+            record = config["jobs"].get(label)
+            if record is not None:
+                record["last_status"] = f"released:{count_ok(results)}/{len(results)}"
+                save(f"jobs.{label}")
+            return f"🌅 {label}: {count_ok(results)} deferred sends delivered." + failed_note(results)
+
+        launch(bot, None, f"{label} (deferred)", len(group_ids), work, finish)
 
 # =====================================================
 # 🔁 AUTO BROADCAST JOB
 # =====================================================
+# Ek hi minute mein kai jobs fire hon (ya interval job daily job se takraye) to sab ek saath
+# saare groups ko hit karte hain aur 429 aate hain. Planner aas-paas ke runs dekh kar har
+# group ka send SMOOTH_WINDOW ke andar ek stable jitter par failata hai. Delivery sab ko hoti hai.
+
+SMOOTH_WINDOW = float(os.getenv("SMOOTH_WINDOW", "60"))  # seconds; 0 = never spread
+CAMPAIGNS_RUNNING = {}  # job name -> monotonic start time of its in-progress run
+
+
+def colliding_runs(job_name: str) -> list:
+    """Other campaigns running now, fired or due within SMOOTH_WINDOW of now."""
+    now = time.time()
+    due = SCHEDULER.fires_between(now - SMOOTH_WINDOW, now + SMOOTH_WINDOW)
+    fired = (name for fire_at, name in SCHEDULER.recent if now - fire_at <= SMOOTH_WINDOW)
+    return sorted({*CAMPAIGNS_RUNNING, *due, *fired} - {job_name})
+
+
+def plan_offsets(job_name: str, group_ids) -> dict:
+    """{gid: delay} spreading this run over SMOOTH_WINDOW when it collides with others.
+
+    The jitter is a hash of (job, group), so one group's sends from different
+    jobs land at different points of the window instead of in the same second.
+    Empty dict when there is nothing to smooth.
+    """
+    if SMOOTH_WINDOW <= 0 or len(group_ids) < 2 or not colliding_runs(job_name):
+        return {}
+    prefix = f"{job_name}:".encode()
+    return {gid: zlib.crc32(prefix + str(gid).encode()) / 2**32 * SMOOTH_WINDOW for gid in group_ids}
+
 
 # =====================================================
 # 🔁 AUTO BROADCAST JOB (Modified with Logging)
@@ -231,6 +2646,8 @@ async def allow_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = int(context.args[0])
         if user_id not in config["whitelist"]:
             config["whitelist"].append(user_id)
+            save("whitelist")
+            refresh_acl()
             await update.message.reply_text(f"✅ User `{user_id}` ko whitelist kar diya gaya hai. Ab wo details badal sakta hai.")
         else:
             await update.message.reply_text("ℹ️ Ye user pehle se whitelist mein hai.")
@@ -244,6 +2661,8 @@ async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = int(context.args[0])
         if user_id in config["whitelist"]:
             config["whitelist"].remove(user_id)
+            save("whitelist")
+            refresh_acl()
             await update.message.reply_text(f"🚫 User `{user_id}` ki permission revoke kar di gayi hai.")
         else:
             await update.message.reply_text("❌ Ye user whitelist mein nahi hai.")
@@ -252,28 +2671,28 @@ async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def clearpool(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Legacy command: clear source message of a job (Usage: /clearpool 1)"""
+    """Legacy command: clear source message of a job (Usage: /clearpool 1 | /clearpool promo)"""
     if not is_admin(update):
         return
 
     try:
-        job_id = int(context.args[0])
-        if job_id < 1 or job_id > JOB_COUNT:
-            raise ValueError
+        name = job_name_arg(context.args[0])
     except (IndexError, ValueError):
-        return await update.message.reply_text("❌ Usage: `/clearpool <id>` (Example: /clearpool 1)", parse_mode="Markdown")
+        return await update.message.reply_text("❌ Usage: `/clearpool <job>` (Example: /clearpool 1)", parse_mode="Markdown")
+
+    rec = config["jobs"].get(name)
+    if rec:
+        rec["from_chat_id"] = None
+        rec["message_id"] = None
+        rec["is_active"] = False
+        rec["next_run"] = None
+        save(f"jobs.{name}")
 
-    name = f"job_{job_id}"
-    if name in config["jobs"]:
-        config["jobs"][name]["from_chat_id"] = None
-        config["jobs"][name]["message_id"] = None
-        config["jobs"][name]["is_active"] = False
-        
         # Timer bhi hata dete hain taaki empty pool error na aaye
-        for j in context.application.job_queue.get_jobs_by_name(name):
-            j.schedule_removal()
+        SCHEDULER.cancel(name)
+        DEFERRED.drop(name)
 
-        await update.message.reply_text(f"🗑️ **Job {job_id} ka source message clear kar diya gaya hai.**\nAb ye job inactive hai.")
+        await update.message.reply_text(f"🗑️ **Job {name} ka source message clear kar diya gaya hai.**\nAb ye job inactive hai.")
     else:
         await update.message.reply_text("❌ Invalid Job ID.")
 
@@ -282,101 +2701,106 @@ async def resetallpools(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
 
-    for i in range(1, JOB_COUNT + 1):
-        name = f"job_{i}"
-        config["jobs"][name]["from_chat_id"] = None
-        config["jobs"][name]["message_id"] = None
-        config["jobs"][name]["is_active"] = False
-        
-        for j in context.application.job_queue.get_jobs_by_name(name):
-            j.schedule_removal()
+    SCHEDULER.clear()
+    DEFERRED.drop()
+    for name, rec in config["jobs"].items():
+        rec["from_chat_id"] = None
+        rec["message_id"] = None
+        rec["is_active"] = False
+        rec["next_run"] = None
+        save(f"jobs.{name}")
 
     await update.message.reply_text("🚨 **All Job Messages Cleared!**\nSaare jobs reset ho gaye hain aur automation band kar di gayi hai.")
 
-async def auto_broadcast_job(context: ContextTypes.DEFAULT_TYPE):
+async def auto_broadcast_job(application: Application, job_name: str):
+    """SCHEDULER callback: send one job's source message to its target(s)."""
     # Timing check ke liye log
     ist = get_ist_now()
     now = ist
     hour = now.hour
-    
-    # Determine job name if available
-    job_name = None
-    try:
-        job_name = context.job.name if getattr(context, 'job', None) else None
-    except Exception:
-        job_name = None
 
-    print(f"🔁 Auto job triggered (IST) at: {now.strftime('%Y-%m-%d %H:%M:%S')} | job={job_name} | Night Start: {config['night_start']}, Night End: {config['night_end']}")
+    log.info("🔁 Auto job triggered (IST) at: %s | Night Start: %s, Night End: %s",
+             now.strftime('%Y-%m-%d %H:%M:%S'), config['night_start'], config['night_end'], extra={"job": job_name})
     
     # job-specific logic: use stored source message for this job
     record = config.get("jobs", {}).get(job_name)
     if not record:
-        print(f"⚠️ No config record for {job_name}, skipping")
+        log.warning("⚠️ No config record for %s, skipping", job_name, extra={"job": job_name})
         return
 
     if not record.get("is_active"):
-        print(f"⏸ {job_name} is inactive, skipping")
+        log.info("⏸ %s is inactive, skipping", job_name, extra={"job": job_name})
         record["last_run"] = now.isoformat()
         record["last_status"] = "skipped:inactive"
+        save(f"jobs.{job_name}")
         return
 
     from_chat = record.get("from_chat_id")
     msg_id = record.get("message_id")
     if not from_chat or not msg_id:
-        print(f"⚠️ {job_name} has no source message, skipping")
+        log.warning("⚠️ %s has no source message, skipping", job_name, extra={"job": job_name})
         record["last_run"] = now.isoformat()
         record["last_status"] = "skipped:no-message"
+        save(f"jobs.{job_name}")
         return
 
-    is_night = night_mode()
-    print(f"📊 Current IST hour: {hour} | Night Mode: {is_night}")
-    if is_night:
-        print(f"🌙 {job_name} skipped due to night mode")
-        record["last_run"] = now.isoformat()
-        record["last_status"] = "skipped:night"
+    if job_name in CAMPAIGNS_RUNNING:
+        # Interval fan-out se chhota hai — naya run pichhle wale mein hi merge (stack nahi hota)
+        running_for = time.monotonic() - CAMPAIGNS_RUNNING[job_name]
+        log.info("⏩ %s still sending (%.0fs), run coalesced", job_name, running_for, extra={"job": job_name})
+        record["last_status"] = "coalesced"
+        save(f"jobs.{job_name}")
         return
 
     # =====================================================
     # 🎯 TARGETED LOGIC PATCH
     # =====================================================
     target_gid = record.get("target_group") # Specific ID or None
-    target_list = [target_gid] if target_gid else GROUP_IDS
-    dest_log = f"Specific Group ({target_gid})" if target_gid else f"{len(GROUP_IDS)} groups"
-    
-    print(f"📤 {job_name}: Sending message to {dest_log}...")
+    target_list = [target_gid] if target_gid else REGISTRY.active()
+
+    # 🌙 Quiet hours: sleeping groups get it when their window ends (DEFERRED)
+    held = hold_quiet(job_name, target_list, "copy", {"from_chat_id": from_chat, "message_id": msg_id})
+    log.debug("📊 Current IST hour: %d | Quiet groups: %d", hour, len(held), extra={"job": job_name})
+    if held:
+        target_list = [gid for gid in target_list if gid not in held]
+    deferred_note = f" deferred:{len(held)}" if held else ""
+    if not target_list:
+        log.info("🌙 %s: all %d target groups are in quiet hours, deferred", job_name, len(held), extra={"job": job_name})
+        record["last_run"] = now.isoformat()
+        record["last_status"] = deferred_note.strip()
+        save(f"jobs.{job_name}")
+        return
+    dest_log = f"Specific Group ({target_gid})" if target_gid else f"{len(target_list)} groups"
+
+    offsets = plan_offsets(job_name, target_list)
+    if offsets:
+        dest_log += f", spread over {SMOOTH_WINDOW:.0f}s (collides with {', '.join(colliding_runs(job_name)[:5])})"
+    log.info("📤 %s: Sending message to %s...", job_name, dest_log, extra={"job": job_name})
     record["last_run"] = now.isoformat()
     record["last_status"] = "running"
 
-    for gid in target_list:
-        try:
-            await context.bot.copy_message(
-                chat_id=gid,
-                from_chat_id=from_chat,
-                message_id=msg_id
-            )
-            await asyncio.sleep(0.5)
-        except Exception as e:
-            print(f"❌ Failed for {gid}: {e}")
-
-    # update next run and keep schedule time
+    CAMPAIGNS_RUNNING[job_name] = time.monotonic()
+    op = track_current(job_name, len(target_list))
     try:
-        job_list = context.application.job_queue.get_jobs_by_name(job_name)
-        if job_list:
-            job = job_list[0]
-            next_rt = getattr(job, 'next_run_time', getattr(job, 'next_t', None))
-            record["next_run"] = next_rt.isoformat() if next_rt else None
-    except Exception:
-        pass
-
-    # update next run and keep schedule time
-    try:
-        job_list = context.application.job_queue.get_jobs_by_name(job_name)
-        if job_list:
-            job = job_list[0]
-            next_rt = getattr(job, 'next_run_time', getattr(job, 'next_t', None))
-            record["next_run"] = next_rt.isoformat() if next_rt else None
-    except Exception:
-        pass
+        results = await dispatch(
+            application.bot, "copy", target_list, job_name, offsets, op, from_chat_id=from_chat, message_id=msg_id
+        )
+    except asyncio.CancelledError:
+        outcome = "paused" if op.suspended else "cancelled"
+        log.info("🛑 %s %s after %d/%d groups", job_name, outcome, op.sent, len(target_list), extra={"job": job_name, "op": op.id})
+        record["last_status"] = f"{outcome}:{op.sent}/{len(target_list)}"
+        save(f"jobs.{job_name}")
+        raise
+    finally:
+        del CAMPAIGNS_RUNNING[job_name]
+        OPERATIONS.pop(op.id, None)
+    for gid, res in results.items():
+        if isinstance(res, Exception):
+            log.warning("❌ Failed for %s: %s", gid, res, extra={"job": job_name, "group": gid, "sample": "send_failed"})
+    log.info("✅ %s: delivered to %d/%d groups", job_name, count_ok(results), len(target_list), extra={"job": job_name, "op": op.id})
+    record["last_status"] = f"sent:{count_ok(results)}/{len(target_list)}" + deferred_note
+    record["next_run"] = fire_time_iso(SCHEDULER.next_run(job_name), record)
+    save(f"jobs.{job_name}")
 
 # =====================================================
 # 🛠 COMMANDS
@@ -397,41 +2821,54 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "━━━━━━━━━━━━━━━━━━━━━━━\n\n"
         
         "🔄 **AUTOMATION (JOB SYSTEM)**\n"
-        "• `/setjob <id> <time/mins>`\n"
+        "• `/setjob <job> <time/mins/cron>` (job = number or name)\n"
         "  - *Daily (IST):* Reply to msg + `/setjob 1 08:30`\n"
-        "  - *Interval:* Reply to msg + `/setjob 1 45` (mins)\n"
-        "• `/stopjob <id>` - Pause a specific job\n"
+        "  - *Interval:* Reply to msg + `/setjob 1 45` (mins) or `every 2h`\n"
+        "  - *Cron:* `/setjob promo cron 30 8 * * 1-5 tz=Europe/Berlin`\n"
         "  - *Single Group:* Reply + `/setjob 1 45 -100xxx`\n"
+        "• `/stopjob <job>` - Pause a specific job\n"
+        "• `/deljob <job>` - Delete a job\n"
         "• `/autoon` - Resume all configured jobs\n"
         "• `/stopall` - Global kill-switch for all timers\n"
-        "• `/status` - Check active timers & message setup\n\n"
+        "• `/status [job|all|health]` - Check active timers & message setup\n\n"
 
         "🛡️ **SECURITY & GROUP LOCK**\n"
         "• `/setgname <name>` : Sabhi groups mein numbering (01, 02...) ke saath name lock karein.\n"
         "• `/setgdesc <text>` : Sabhi groups ka description (Bio) lock karein.\n"
         "• `/setgpic` : Photo par reply karein DP lock karne ke liye.\n"
         "• `/allow <ID>` : Kisi user ko whitelist karein (Permissions dena).\n"
-        "• `/remove <ID>` : Whitelist se user ko hatayein.\n\n"
+        "• `/remove <ID>` : Whitelist se user ko hatayein.\n"
+        "• `/filter add|del word|link|channel <value>` : Spam words, domains ya forwarded channels auto-delete karein.\n\n"
 
         "🗑️ **JOB MESSAGE RESET**\n"
-        "• `/clearpool <id>` - Clear source msg of Job <id>\n"
+        "• `/clearpool <job>` - Clear source msg of a job\n"
         "• `/resetallpools` - Clear source msgs of all jobs\n\n"
         
         "📢 **BROADCAST & ENGAGEMENT**\n"
         "• `/broadcast` - Reply to msg to send in all groups\n"
         "• `/pin` - Send and pin message everywhere\n"
-        "• `/unpinall` - Remove pins from all groups\n\n"
+        "• `/unpinall [force]` - Remove our last pin (force: every pin)\n"
+        "• `/recall [id|label]` - Delete a sent broadcast from all groups\n"
+        "• `/deadletters` - Failed sends list\n"
+        "• `/replay all|<no>` - Retry failed sends\n"
+        "• `/cleardead` - Clear failed sends list\n"
+        "• `/cancel [id]` - Running bulk jobs / stop one\n\n"
         
         "🏢 **GROUP MANAGEMENT**\n"
         "• `/info` - List all groups with member count & links\n"
         "• `/stats` - Total group count summary\n"
+        "• `/groups` - Active / pending / left groups\n"
+        "• `/addgroup <id>` / `/delgroup <id>` - Manage group list\n"
+        "• `/shards [probe]` - Groups per bot token\n"
         "• `/setgname <name>` - Update all group titles\n"
         "• `/setgdesc <text>` - Update all descriptions\n"
         "• `/setgpic` - Reply to photo to change all DPs\n\n"
         
         "⚙️ **SYSTEM SETTINGS**\n"
         "• `/settings <start> <end>` - Night mode (e.g., `23 7`)\n"
-        "  - *Use `0 0` to disable Night Mode*\n\n"
+        "  - *Use `0 0` to disable Night Mode*\n"
+        "• `/quiet <id> <start> <end>|off` - Quiet hours for one group\n"
+        "  - *Sends during quiet hours are held and delivered after*\n\n"
         "━━━━━━━━━━━━━━━━━━━━━━━\n"
         "💡 *Note: Use IST (Indian Standard Time) for all scheduling.*"
     )
@@ -446,164 +2883,605 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 🚫 BLACKLIST SYSTEM (Auto-Delete Specific User)
 # =====================================================
 
-# Blacklisted User IDs ki list (Isse aap /block command se update kar payenge)
-config.setdefault("blacklist", [])
+# Blacklisted User IDs ki list (Isse aap /block command se update kar payenge)
+config.setdefault("blacklist", [])
+
+async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """User ko blacklist mein daalne ke liye (Usage: /block 12345678)"""
+    if not is_admin(update): return
+    try:
+        target_id = int(context.args[0])
+        if target_id not in config["blacklist"]:
+            config["blacklist"].append(target_id)
+            save("blacklist")
+            refresh_acl()
+            await update.message.reply_text(f"🚫 User `{target_id}` ko blacklist kar diya gaya hai. Ab iske saare messages auto-delete honge.", parse_mode="Markdown")
+        else:
+            await update.message.reply_text("⚠️ Ye user pehle se blacklisted hai.")
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ Usage: `/block <user_id>`", parse_mode="Markdown")
+
+async def unblock_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """User ko blacklist se hatane ke liye (Usage: /unblock 12345678)"""
+    if not is_admin(update): return
+    try:
+        target_id = int(context.args[0])
+        if target_id in config["blacklist"]:
+            config["blacklist"].remove(target_id)
+            save("blacklist")
+            refresh_acl()
+            await update.message.reply_text(f"✅ User `{target_id}` ko whitelist kar diya gaya hai.", parse_mode="Markdown")
+        else:
+            await update.message.reply_text("⚠️ Ye user blacklist mein nahi hai.")
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ Usage: `/unblock <user_id>`", parse_mode="Markdown")
+
+# =====================================================
+# 🧹 CONTENT FILTER (banned words, links, forwarded channels)
+# =====================================================
+# Blacklist sirf user ID dekhta hai; ye rules message ka content dekhte hain.
+# config["content_rules"] -> CONTENT (compiled). Words ek Aho-Corasick automaton mein
+# hain, isliye har message ek hi pass mein check hota hai — rules 10 hon ya 10,000. Words
+# poore shabd match hote hain ("ass" se "class" delete nahi hota); links plain substring/host.
+# Links aur channels plain set lookups hain. /filter se badlo; naya automaton thread mein
+# banta hai aur phir swap hota hai, event loop nahi rukta.
+
+ANY = "*"  # link/channel rule matching every link / every channel forward
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over casefolded phrases; search() is O(len(text)).
+
+    Hits only count on word boundaries, like regex \\b: a phrase edge that is a
+    word character can't touch another word character in the text.
+    """
+
+    __slots__ = ("goto", "fail", "terminal", "out", "phrases")
+
+    def __init__(self, phrases=()):
+        self.goto = [{}]        # node -> {char: node}
+        self.fail = [0]         # longest proper suffix that is also a trie path
+        self.terminal = [None]  # phrase ending exactly at this node
+        self.out = [0]          # nearest node down the fail chain (self included) ending a phrase
+        self.phrases = set()
+        self.add(phrases)
+
+    def add(self, phrases):
+        """Insert phrases into the existing trie, then relink (no rebuild from scratch)."""
+        added = False
+        for phrase in phrases:
+            if not phrase or phrase in self.phrases:
+                continue
+            self.phrases.add(phrase)
+            node = 0
+            for ch in phrase:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(None)
+                    self.out.append(0)
+                node = nxt
+            self.terminal[node] = phrase
+            added = True
+        if added:
+            self._link()
+
+    def _link(self):
+        goto, fail, terminal, out = self.goto, self.fail, self.terminal, self.out
+        pending = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            out[child] = child if terminal[child] else 0
+            pending.append(child)
+        while pending:
+            node = pending.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                out[child] = child if terminal[child] else out[fail[child]]
+                pending.append(child)
+
+    def search(self, text: str):
+        """First banned phrase found as a whole word in `text` (already casefolded), else None."""
+        goto, fail, out, terminal = self.goto, self.fail, self.out, self.terminal
+        node = 0
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = out[node]
+            while hit:  # every phrase ending here, longest first
+                phrase = terminal[hit]
+                start = end - len(phrase)
+                if ((start == 0 or not (word_char(phrase[0]) and word_char(text[start - 1])))
+                        and (end == len(text) or not (word_char(phrase[-1]) and word_char(text[end])))):
+                    return phrase
+                hit = out[fail[hit]]
+        return None
+
+
+def word_char(ch: str) -> bool:
+    # Matras / combining marks (Mn, Mc) bhi shabd ka hissa hain — "राम" != "रामा"
+    return ch.isalnum() or ch == "_" or unicodedata.category(ch)[0] == "M"
+
+
+def link_host(url: str):
+    try:
+        return urlsplit(url if "://" in url else f"http://{url}").hostname
+    except ValueError:
+        return None
+
+
+def channel_key(value):
+    """`-100123` -> -100123, `@Name` / `t.me/Name` -> "name"."""
+    value = str(value).strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return value.rsplit("/", 1)[-1].lstrip("@").lower()
+
+
+class ContentIndex:
+    """Compiled form of config["content_rules"]."""
+
+    def __init__(self):
+        self.words = PhraseMatcher()
+        self.links = frozenset()
+        self.channels = frozenset()
+        self.active = False
+
+    @staticmethod
+    def word_set(rules: dict) -> set:
+        return {w.casefold() for w in rules.get("words", []) if w.strip()}
+
+    def sync(self, rules: dict, matcher: PhraseMatcher = None) -> str:
+        """Bring the index in line with `rules`. `matcher`: the word automaton already
+        built for them (off the event loop, see rebuild_content); else built here."""
+        words = self.word_set(rules)
+        if matcher is None and words != self.words.phrases:
+            matcher = PhraseMatcher(words)
+        rebuilt = "no words"
+        if matcher is not None:
+            self.words = matcher  # ek attribute swap — chal raha match purana automaton dekhta rahega
+            rebuilt = f"all {len(words)} words"
+        self.links = frozenset(str(d).lower() for d in rules.get("links", []))
+        self.channels = frozenset(channel_key(c) for c in rules.get("channels", []))
+        self.active = bool(words or self.links or self.channels)
+        return rebuilt
+
+    def match_host(self, host: str):
+        if ANY in self.links:
+            return host
+        while host:
+            if host in self.links:
+                return host
+            host = host.partition(".")[2]
+        return None
+
+    def match(self, message):
+        """Why `message` breaks a rule ("word ...", "link ...", "channel ..."), or None."""
+        if not self.active:
+            return None
+        text = message.text or message.caption
+        if text and self.words.phrases:
+            phrase = self.words.search(text.casefold())
+            if phrase is not None:
+                return f"word {phrase!r}"
+        if self.links and (message.entities or message.caption_entities):
+            found = {**message.parse_entities(LINK_ENTITIES), **message.parse_caption_entities(LINK_ENTITIES)}
+            for entity, value in found.items():
+                host = link_host(entity.url if entity.type == MessageEntity.TEXT_LINK else value)
+                if host and self.match_host(host):
+                    return f"link {host}"
+        origin = message.forward_origin
+        if self.channels and origin is not None and getattr(origin, "chat", None) is not None:
+            chat = origin.chat
+            if ANY in self.channels or chat.id in self.channels or (chat.username or "").lower() in self.channels:
+                return f"channel {chat.username or chat.id}"
+        return None
+
+
+LINK_ENTITIES = [MessageEntity.URL, MessageEntity.TEXT_LINK]
+CONTENT = ContentIndex()
+
+
+def refresh_content() -> str:
+    """Recompile CONTENT — call after config load (see rebuild_content for live edits)."""
+    rules = config.setdefault("content_rules", {})
+    for kind in ("words", "links", "channels"):
+        rules.setdefault(kind, [])
+    return CONTENT.sync(rules)
+
+
+CONTENT_REBUILD = asyncio.Lock()  # ek waqt mein ek rebuild — aakhri swap hamesha latest rules ka
+
+
+async def rebuild_content() -> str:
+    """refresh_content() for /filter: 10k words ka automaton thread mein banta hai, fir swap."""
+    async with CONTENT_REBUILD:
+        rules = config["content_rules"]
+        words = ContentIndex.word_set(rules)
+        matcher = None
+        if words != CONTENT.words.phrases:
+            matcher = await asyncio.to_thread(PhraseMatcher, words)
+        return CONTENT.sync(rules, matcher)
+
+
+class ContentSpam(filters.MessageFilter):
+    """Passes messages from unprivileged users that break a content rule."""
+
+    def filter(self, message) -> bool:
+        if not CONTENT.active or (message.from_user is not None and message.from_user.id in ACL.privileged):
+            return False
+        return CONTENT.match(message) is not None
+
+
+CONTENT_SPAM = ContentSpam(name="ContentSpam")
+
+
+async def content_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/filter add|del <word|link|channel> <value> — content rules; /filter lists them."""
+    if not is_admin(update):
+        return
+    rules = config["content_rules"]
+    args = context.args
+    if not args:
+        lines = [f"🧹 **Content rules** — {len(rules['words'])} words, {len(rules['links'])} links, "
+                 f"{len(rules['channels'])} channels"]
+        for kind in ("words", "links", "channels"):
+            if rules[kind]:
+                shown = ", ".join(f"`{value}`" for value in rules[kind][:30])
+                more = f" … +{len(rules[kind]) - 30}" if len(rules[kind]) > 30 else ""
+                lines.append(f"• {kind}: {shown}{more}")
+        return await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+    try:
+        action, kind, value = args[0].lower(), args[1].lower().rstrip("s") + "s", " ".join(args[2:]).strip()
+        if action not in ("add", "del") or kind not in rules or not value:
+            raise ValueError(action)
+        if kind == "words":
+            value = value.casefold()
+        elif kind == "links":
+            value = value if value == ANY else link_host(value)
+            if not value:
+                raise ValueError("bad link")
+        else:
+            value = channel_key(value)
+    except (IndexError, ValueError):
+        return await update.message.reply_text(
+            "❌ Usage: /filter add|del word <phrase>\n• /filter add|del link <domain or * for all links>\n"
+            "• /filter add|del channel <@name | -100id | * for all forwards>\n• /filter — list"
+        )
+    if action == "add":
+        if value in rules[kind]:
+            return await update.message.reply_text("⚠️ Ye rule pehle se hai.")
+        rules[kind].append(value)
+    else:
+        if value not in rules[kind]:
+            return await update.message.reply_text("⚠️ Aisa koi rule nahi hai.")
+        rules[kind].remove(value)
+    save("content_rules")
+    rebuilt = await rebuild_content()
+    log.info("🧹 Content rule %s %s %r (rebuilt %s)", action, kind, value, rebuilt)
+    await update.message.reply_text(
+        f"{'🧹 Added' if action == 'add' else '✅ Removed'} {kind[:-1]} `{value}` — "
+        f"{len(rules['words'])} words, {len(rules['links'])} links, {len(rules['channels'])} channels active.",
+        parse_mode="Markdown",
+    )
+
+
+# =====================================================
+# 🌊 FLOOD GUARD (per-user + per-chat message rate)
+# =====================================================
+# Har (group, user) ka sliding window counter: FLOOD_WINDOW seconds ke 1s buckets ek
+# chhote array mein (ring buffer). Limit cross hui to user FLOOD_MUTE seconds ke liye
+# mute (bot ke paas restrict right ho to) aur us dauran uske messages delete hote hain.
+# Poora group flood ho raha ho (raid) to per-user limit aadhi ho jati hai.
+# Counters LRU mein hain — FLOOD_TRACKED se zyada pairs hon to sabse purana nikal jata hai.
+
+FLOOD_LIMIT = int(os.getenv("FLOOD_LIMIT", "10"))               # messages per user per window
+FLOOD_CHAT_LIMIT = int(os.getenv("FLOOD_CHAT_LIMIT", "60"))    # messages per group per window (raid)
+FLOOD_WINDOW = int(os.getenv("FLOOD_WINDOW", "10"))            # seconds, 1s buckets
+FLOOD_MUTE = int(os.getenv("FLOOD_MUTE", "300"))               # seconds muted / messages deleted
+FLOOD_TRACKED = int(os.getenv("FLOOD_TRACKED", "20000"))       # (group, user) pairs kept in memory
+
+
+class WindowCounter:
+    """Messages in the last FLOOD_WINDOW seconds, bucketed per second in a ring."""
+
+    __slots__ = ("tick", "total", "buckets", "until", "tripped")
+
+    def __init__(self):
+        self.tick = 0                                # second of the newest bucket
+        self.total = 0
+        self.buckets = array("H", bytes(2 * FLOOD_WINDOW))
+        self.until = 0.0                             # monotonic time the penalty ends (users only)
+        self.tripped = False                         # crossed the limit, penalty not applied yet
+
+    def hit(self, tick: int) -> int:
+        buckets = self.buckets
+        size = len(buckets)
+        if tick - self.tick >= size:
+            buckets[:] = array("H", bytes(2 * size))
+            self.total = 0
+        else:
+            for t in range(self.tick + 1, tick + 1):
+                self.total -= buckets[t % size]
+                buckets[t % size] = 0
+        self.tick = tick
+        if buckets[tick % size] < 0xFFFF:
+            buckets[tick % size] += 1
+            self.total += 1
+        return self.total
+
+
+class FloodGuard:
+    """LRU of WindowCounter per (chat, user) plus one per chat; memory is bounded by FLOOD_TRACKED."""
+
+    def __init__(self, limit: int = FLOOD_TRACKED):
+        self.limit = limit
+        self.users = OrderedDict()  # (gid, user_id) -> WindowCounter
+        self.chats = OrderedDict()  # gid -> WindowCounter
+        self.raids = set()          # groups over FLOOD_CHAT_LIMIT right now (logged once)
+
+    def _counter(self, table: OrderedDict, key) -> WindowCounter:
+        counter = table.get(key)
+        if counter is None:
+            counter = table[key] = WindowCounter()
+            if len(table) > self.limit:
+                evicted, _ = table.popitem(last=False)
+                self.raids.discard(evicted)
+        else:
+            table.move_to_end(key)
+        return counter
+
+    def check(self, gid, user_id) -> bool:
+        """Count one message; True if the sender is flooding (or still under penalty)."""
+        now = time.monotonic()
+        user = self._counter(self.users, (gid, user_id))
+        if user.until > now:
+            return True
+        tick = int(now)
+        in_chat = self._counter(self.chats, gid).hit(tick)
+        limit = FLOOD_LIMIT
+        if in_chat > FLOOD_CHAT_LIMIT:
+            limit = max(2, FLOOD_LIMIT // 2)
+            if gid not in self.raids:
+                self.raids.add(gid)
+                log.warning("🌊 Flood in %s: %d messages in %ds, per-user limit now %d",
+                            gid, in_chat, FLOOD_WINDOW, limit, extra={"group": gid})
+        elif gid in self.raids:
+            self.raids.discard(gid)
+        if user.hit(tick) > limit:
+            user.until = now + FLOOD_MUTE
+            user.tripped = True
+            return True
+        return False
+
+    def take_trip(self, gid, user_id) -> bool:
+        """True once per penalty — the caller applies the mute."""
+        user = self.users.get((gid, user_id))
+        if user is None or not user.tripped:
+            return False
+        user.tripped = False
+        return True
+
+    def penalised(self, gid, user_id) -> bool:
+        user = self.users.get((gid, user_id))
+        return user is not None and user.until > time.monotonic()
+
+    def active_penalties(self) -> int:
+        now = time.monotonic()
+        return sum(1 for user in self.users.values() if user.until > now)
+
+
+FLOOD = FloodGuard()
+
+
+class Flooding(filters.MessageFilter):
+    """Counts every new unprivileged group message; passes the ones over the flood limit.
+
+    Edits and service messages (joins, pins, title changes) are not counted —
+    they aren't someone typing fast.
+    """
+
+    def check_update(self, update) -> bool:
+        message = update.message  # edited_message / channel_post nahi
+        if message is None:
+            return False
+        # Text ya caption wala message kabhi service message nahi hota — StatusUpdate.ALL mehenga hai
+        if not (message.text or message.caption) and filters.StatusUpdate.ALL.check_update(update):
+            return False
+        return self.filter(message)
+
+    def filter(self, message) -> bool:
+        if message.from_user is None or message.from_user.id in ACL.privileged or message.chat_id > 0:
+            return False
+        return FLOOD.check(message.chat_id, message.from_user.id)
+
 
-async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """User ko blacklist mein daalne ke liye (Usage: /block 12345678)"""
-    if not is_admin(update): return
-    try:
-        target_id = int(context.args[0])
-        if target_id not in config["blacklist"]:
-            config["blacklist"].append(target_id)
-            await update.message.reply_text(f"🚫 User `{target_id}` ko blacklist kar diya gaya hai. Ab iske saare messages auto-delete honge.", parse_mode="Markdown")
-        else:
-            await update.message.reply_text("⚠️ Ye user pehle se blacklisted hai.")
-    except (IndexError, ValueError):
-        await update.message.reply_text("❌ Usage: `/block <user_id>`", parse_mode="Markdown")
+FLOODING = Flooding(name="Flooding")
 
-async def unblock_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """User ko blacklist se hatane ke liye (Usage: /unblock 12345678)"""
-    if not is_admin(update): return
+
+async def mute_flooder(bot, gid, user_id):
+    """Restrict for FLOOD_MUTE seconds; without the right, deletes alone carry the penalty."""
+    if not can(gid, CAN_RESTRICT):
+        log.info("🌊 %s flooding %s — no restrict right, deleting for %ds", user_id, gid, FLOOD_MUTE,
+                 extra={"user": user_id, "group": gid, "sample": "flood_mute"})
+        return
     try:
-        target_id = int(context.args[0])
-        if target_id in config["blacklist"]:
-            config["blacklist"].remove(target_id)
-            await update.message.reply_text(f"✅ User `{target_id}` ko whitelist kar diya gaya hai.", parse_mode="Markdown")
-        else:
-            await update.message.reply_text("⚠️ Ye user blacklist mein nahi hai.")
-    except (IndexError, ValueError):
-        await update.message.reply_text("❌ Usage: `/unblock <user_id>`", parse_mode="Markdown")
+        await tg_call(bot.restrict_chat_member, dead_letter=False, chat_id=gid, user_id=user_id,
+                      permissions=ChatPermissions.no_permissions(), until_date=int(time.time()) + FLOOD_MUTE)
+        log.info("🔇 Muted %s in %s for %ds (flood)", user_id, gid, FLOOD_MUTE,
+                 extra={"user": user_id, "group": gid, "sample": "flood_mute"})
+    except Exception as e:
+        log.warning("❌ Flood mute failed for %s: %s", user_id, e,
+                    extra={"user": user_id, "group": gid, "sample": "flood_mute_error"})
+
 
 # --- MAIN LOGIC (Ye har message ko check karega) ---
 async def delete_spammer_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message: return
     
     user_id = update.effective_user.id
-    # Blacklist check
-    if user_id in config.get("blacklist", []):
+    gid = update.effective_chat.id
+    if FLOOD.take_trip(gid, user_id):
+        await mute_flooder(context.bot, gid, user_id)
+    # FLOODING / BLACKLISTED / CONTENT_SPAM filters already dropped everyone else
+    reason = "blacklist" if user_id in ACL.blacklist else CONTENT.match(update.message)
+    if reason is None and FLOOD.penalised(gid, user_id):
+        reason = "flood"
+    if reason is not None and can(gid, CAN_DELETE):
         try:
             await update.message.delete()
-            print(f"🗑️ Spammer message deleted: {user_id}")
+            log.info("🗑️ Spammer message deleted: %s (%s)", user_id, reason,
+                     extra={"user": user_id, "group": gid, "sample": "spam_deleted"})
         except Exception as e:
-            print(f"❌ Spammer Delete Error: {e}")
+            log.warning("❌ Spammer Delete Error: %s", e,
+                        extra={"user": user_id, "group": gid, "sample": "spam_delete_error"})
+
+def job_name_arg(arg: str) -> str:
+    """`3` -> `job_3` (old numbered slots); otherwise a short name like `promo_eu`."""
+    if arg.isdigit():
+        return f"job_{int(arg)}"
+    if not (0 < len(arg) <= 32 and arg.replace("_", "").replace("-", "").isalnum()):
+        raise ValueError(f"bad job name {arg!r}")
+    return arg
+
 
 async def setjob(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin(update): return
+    """Reply to a message: /setjob <job> <08:30 | 45 | every 2h | cron m h dom mon dow> [group_id] [tz=Zone]"""
+    if not is_admin(update):
+        return
+    usage = (
+        "❌ Usage (reply to a message):\n"
+        "`/setjob 1 08:30` • `/setjob promo 45` • `/setjob promo every 2h`\n"
+        "`/setjob promo cron 30 8 * * 1-5 [-100id] [tz=Europe/Berlin]`"
+    )
     if not update.message.reply_to_message:
-        return await update.message.reply_text("❌ Reply to a message when using /setjob <id> <time/mins> [target_id]")
+        return await update.message.reply_text(usage, parse_mode="Markdown")
 
     try:
-        args = context.args
-        job_id = int(args[0])
-        input_val = args[1]
-        
-        # --- TARGET ID PATCH ---
-        target_group = int(args[2]) if len(args) > 2 else None
-
-        if job_id < 1 or job_id > JOB_COUNT:
-            return await update.message.reply_text(f"❌ Job id must be 1-{JOB_COUNT}")
-
-        name = f"job_{job_id}"
-        rec = config["jobs"][name]
-        
-        # Store one source message per job
-        rec["from_chat_id"] = update.message.chat_id
-        rec["message_id"] = update.message.reply_to_message.message_id
-        rec["target_group"] = target_group # Save target ID
-
-        # Scheduling logic
-        if ":" in input_val:
-            hh, mm = map(int, input_val.split(":"))
-            schedule_daily_job(context, name, hh, mm)
-            rec["time"] = f"{hh:02d}:{mm:02d}"
-            mode_text = f"daily at {format_time_12h(rec['time'])} IST"
+        args = list(context.args)
+        name = job_name_arg(args.pop(0))
+        tz = None
+        if args and args[-1].startswith("tz="):
+            tz = args.pop()[3:]
+        if args[0] == "cron":
+            spec = " ".join(["cron", *args[1:6]])
+            rest = args[6:]
+        elif args[0] == "every":
+            spec = f"every {args[1]}"
+            rest = args[2:]
+        elif ":" in args[0]:
+            hh, mm = map(int, args[0].split(":"))
+            spec = f"{hh:02d}:{mm:02d}"
+            rest = args[1:]
         else:
-            mins = int(input_val)
-            for j in context.application.job_queue.get_jobs_by_name(name):
-                j.schedule_removal()
-            context.application.job_queue.run_repeating(
-                auto_broadcast_job, interval=mins*60, first=10, name=name
-            )
-            rec["time"] = f"every {mins}m"
-            mode_text = f"every {mins} minutes"
+            spec = f"every {args[0] if args[0][-1] in 'mh' else args[0] + 'm'}"
+            rest = args[1:]
 
-        rec["is_active"] = True
-        dest_text = f"Target ID: `{target_group}`" if target_group else "All Groups"
-        await update.message.reply_text(
-            f"✅ **Job {job_id} Set!**\n• Destination: {dest_text}\n• Mode: {mode_text}\n• Source message: updated",
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        await update.message.reply_text("❌ Usage: `/setjob 1 08:00 [id]` or `/setjob 1 30 [id]`")
+        # --- TARGET ID PATCH ---
+        target_group = int(rest[0]) if rest else None
+        schedule = parse_schedule(spec, tz)
+    except (IndexError, ValueError):
+        return await update.message.reply_text(usage, parse_mode="Markdown")
+
+    rec = config["jobs"].setdefault(name, new_job_record())
+    # Store one source message per job
+    rec["from_chat_id"] = update.message.chat_id
+    rec["message_id"] = update.message.reply_to_message.message_id
+    rec["target_group"] = target_group # Save target ID
+    rec["time"] = spec
+    rec["tz"] = tz
+    rec["is_active"] = True
+
+    SCHEDULER.add(name, schedule)
+    rec["next_run"] = fire_time_iso(SCHEDULER.next_run(name), rec)
+    save(f"jobs.{name}")
+    dest_text = f"Target ID: `{target_group}`" if target_group else "All Groups"
+    await update.message.reply_text(
+        f"✅ **Job `{name}` Set!**\n• Destination: {dest_text}\n• Mode: {describe_schedule(rec)}\n"
+        f"• Next run: `{rec['next_run'][:19].replace('T', ' ')}`\n• Source message: updated",
+        parse_mode="Markdown"
+    )
 
 
 async def stopjob(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
     try:
-        job_id = int(context.args[0])
+        name = job_name_arg(context.args[0])
     except (IndexError, ValueError):
-        return await update.message.reply_text("❌ Usage: /stopjob <id> (id: 1-5)")
-    
-    if job_id < 1 or job_id > JOB_COUNT:
-        return await update.message.reply_text(f"❌ Job id must be between 1 and {JOB_COUNT}")
+        return await update.message.reply_text("❌ Usage: /stopjob <job>")
+
+    rec = config["jobs"].get(name)
+    if rec is None:
+        return await update.message.reply_text(f"❌ No job named {name}")
+
+    stopped = SCHEDULER.cancel(name)
+    dropped = DEFERRED.drop(name)
 
-    name = f"job_{job_id}"
-    current_jobs = context.application.job_queue.get_jobs_by_name(name)
-    stopped = len(current_jobs)
-    
-    for j in current_jobs:
-        j.schedule_removal()
-    
     # mark inactive
-    config["jobs"][name]["is_active"] = False
-    config["jobs"][name]["last_status"] = "stopped"
+    rec["is_active"] = False
+    rec["last_status"] = "stopped"
+    rec["next_run"] = None
+    save(f"jobs.{name}")
 
     msg = (
-        f"⏹ **Job {job_id} stopped**\n"
+        f"⏹ **Job `{name}` stopped**\n"
         f"• Timer removed (source message preserved)\n"
-        f"• {stopped} active task(s) killed"
+        f"• {int(stopped)} active task(s) killed"
+        + (f"\n• {dropped} held quiet-hour send(s) dropped" if dropped else "")
     )
     await update.message.reply_text(msg, parse_mode="Markdown")
 
 
+async def deljob(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Delete a job completely (Usage: /deljob <job>)"""
+    if not is_admin(update):
+        return
+    try:
+        name = job_name_arg(context.args[0])
+    except (IndexError, ValueError):
+        return await update.message.reply_text("❌ Usage: /deljob <job>")
+    if config["jobs"].pop(name, None) is None:
+        return await update.message.reply_text(f"❌ No job named {name}")
+    SCHEDULER.cancel(name)
+    DEFERRED.drop(name)
+    if STORE is not None:
+        STORE.delete(f"jobs.{name}")
+    await update.message.reply_text(f"🗑️ Job {name} deleted.")
+
 
 async def autoon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
 
     config["is_active"] = True
+    save("is_active")
     resumed_jobs = []
 
-    for i in range(1, JOB_COUNT + 1):
-        name = f"job_{i}"
-        rec = config["jobs"].get(name)
-        
+    for name, rec in config["jobs"].items():
         # Check if job has schedule and source message
-        if rec and rec.get("time") and rec.get("from_chat_id") and rec.get("message_id"):
-            time_str = rec["time"]
+        if job_ready(rec):
             try:
-                if ":" in time_str:
-                    hh, mm = map(int, time_str.split(":"))
-                    schedule_daily_job(context, name, hh, mm)
-                else:
-                    # For interval jobs like "every 30m"
-                    mins = int(time_str.replace("every ", "").replace("m", ""))
-                    context.application.job_queue.run_repeating(
-                        auto_broadcast_job, interval=mins*60, first=10, name=name
-                    )
-                
+                schedule_from_record(name, rec)
                 rec["is_active"] = True
-                resumed_jobs.append(f"Job {i}")
-            except Exception as e:
-                print(f"Error resuming {name}: {e}")
+                save(f"jobs.{name}")
+                resumed_jobs.append(name)
+            except ValueError as e:
+                log.error("Error resuming %s: %s", name, e, extra={"job": name})
 
     if resumed_jobs:
-        msg = f"▶️ **Auto Broadcast Resumed!**\nActive: {', '.join(resumed_jobs)}"
+        shown = ", ".join(f"`{name}`" for name in resumed_jobs[:30]) + (f" +{len(resumed_jobs) - 30} more" if len(resumed_jobs) > 30 else "")
+        msg = f"▶️ **Auto Broadcast Resumed!**\nActive ({len(resumed_jobs)}): {shown}"
     else:
         msg = "⚠️ **No jobs to resume.**\nPehle `/setjob` use karke timing aur message set karein."
-    
+
     await update.message.reply_text(msg, parse_mode="Markdown")
 
 async def autooff(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -611,26 +3489,27 @@ async def autooff(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
     config["is_active"] = False
-    
-    # Remove all job timers (job_1 to job_5)
-    stopped_count = 0
-    for i in range(1, JOB_COUNT + 1):
-        name = f"job_{i}"
-        current_jobs = context.application.job_queue.get_jobs_by_name(name)
-        for job in current_jobs:
-            job.schedule_removal()
-            stopped_count += 1
-            print(f"Log: Removed job '{name}' on /autooff (stopall).")
+    save("is_active")
+
+    # Remove all job timers
+    stopped_count = SCHEDULER.clear()
+    dropped = DEFERRED.drop()
+    for name, rec in config["jobs"].items():
+        if rec.get("is_active") or rec.get("next_run"):
+            # mark stopped in tracking
+            rec["is_active"] = False
+            rec["last_status"] = "stopped"
+            rec["next_run"] = None
+            save(f"jobs.{name}")
+    log.info("Removed %d job timers and %d held sends on /autooff (stopall).", stopped_count, dropped)
 
-        # mark stopped in tracking
-        config["jobs"][name]["is_active"] = False
-        config["jobs"][name]["last_status"] = "stopped"
-
-    await update.message.reply_text(f"⏸ All auto timers killed ({stopped_count} jobs stopped). Broadcast disabled.")
+    await update.message.reply_text(
+        f"⏸ All auto timers killed ({stopped_count} jobs stopped, {dropped} held sends dropped). Broadcast disabled."
+    )
 
 
 async def stopall(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Alias for /autooff - kills all 5 timers and disables auto broadcast."""
+    """Alias for /autooff - kills all job timers and disables auto broadcast."""
     await autooff(update, context)
 
 
@@ -648,6 +3527,7 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             raise ValueError("Hours must be 0-23")
         config["night_start"] = ns
         config["night_end"] = ne
+        save("night_start", "night_end")
         
         if ns == 0 and ne == 0:
             msg = "⚙️ **Night Mode Disabled** (all hours enabled)"
@@ -657,24 +3537,118 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             msg = f"⚙️ **Night Mode Set**: {ns:02d}:00 IST → {ne:02d}:00 IST"
         
         await update.message.reply_text(msg, parse_mode="Markdown")
-        print(f"Log: Night settings updated to {ns:02d}:00 → {ne:02d}:00 (IST)")
+        log.info("Night settings updated to %02d:00 → %02d:00 (IST)", ns, ne)
     except (IndexError, ValueError):
         await update.message.reply_text("❌ Usage: /settings <start_hour> <end_hour>\n• Hours: 0-23 (IST)\n• Example: /settings 23 7 (11 PM to 7 AM)\n• Use: /settings 0 0 to disable")
 
 
+async def quiet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/quiet <group_id> <start> <end> | /quiet <group_id> off — per-group quiet hours (IST)."""
+    if not is_admin(update):
+        return
+    args = context.args
+    if not args:
+        lines = [f"🔕 **Quiet hours** (default = night mode {config['night_start']:02d}→{config['night_end']:02d})"]
+        for gid, (start, end) in sorted(QUIET_HOURS.items())[:50]:
+            lines.append(f"• `{gid}`: {start:02d}:00 → {end:02d}:00")
+        lines.append(f"🌅 Held sends: {len(DEFERRED)}")
+        return await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+    try:
+        gid = int(args[0])
+        if len(args) == 2 and args[1].lower() == "off":
+            config["quiet_hours"].pop(str(gid), None)
+            msg = f"🔔 `{gid}` follows the global night mode again."
+        else:
+            start, end = int(args[1]), int(args[2])
+            if not (0 <= start <= 23 and 0 <= end <= 23):
+                raise ValueError("Hours must be 0-23")
+            config["quiet_hours"][str(gid)] = [start, end]
+            msg = f"🔕 `{gid}` quiet from {start:02d}:00 to {end:02d}:00 IST (`0 0` = never quiet)."
+    except (IndexError, ValueError):
+        return await update.message.reply_text(
+            "❌ Usage: /quiet <group_id> <start_hour> <end_hour>\n• /quiet <group_id> off\n• /quiet — list"
+        )
+    save("quiet_hours")
+    refresh_quiet()
+    await update.message.reply_text(msg, parse_mode="Markdown")
+
+
+STATUS_PAGE = 25  # jobs per /status page
+
+
+def job_line(name: str, rec: dict) -> str:
+    running = name in SCHEDULER
+    has_message = bool(rec.get("from_chat_id") and rec.get("message_id"))
+    line = f"{'▶️' if running else '⏸'} `{name}`: {describe_schedule(rec)} | {rec.get('last_status') or '-'}"
+    if running:
+        fire_at = datetime.fromtimestamp(SCHEDULER.next_run(name), ZoneInfo(rec.get("tz") or DEFAULT_TZ))
+        line += f"\n     ⏭ Next run: `{fire_at.strftime('%d-%m %H:%M:%S')}`"
+        if not has_message:
+            line += "\n    ⚠️ Warning: Source message is missing!"
+    return line
+
+
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show status of all jobs with schedule, next run time, and IST clock."""
+    """Job overview (Usage: /status, /status <job>, /status all [page], /status health)"""
     if not is_admin(update): return
-    ist = get_ist_now()
+    args = context.args or []
+
+    if args and args[0] == "health":
+        sick = sorted(BREAKER.quarantined(), key=lambda item: item[1].opened)
+        if not sick:
+            return await update.message.reply_text("🩺 No quarantined groups.")
+        now = time.time()
+        lines = [f"🩺 **Quarantined groups:** {len(sick)}"]
+        for gid, circuit in sick[:STATUS_PAGE]:
+            wait = max(0, circuit.opened + circuit.cooldown - now)
+            lines.append(f"• `{gid}` {circuit.state}, {circuit.failures} fails, probe in {wait / 60:.0f}m — {circuit.error}")
+        if len(sick) > STATUS_PAGE:
+            lines.append(f"… +{len(sick) - STATUS_PAGE} more")
+        return await update.message.reply_text("\n".join(lines))
+
+    if args and args[0] != "all":
+        try:
+            name = job_name_arg(args[0])
+        except ValueError:
+            name = None
+        rec = config["jobs"].get(name)
+        if rec is None:
+            return await update.message.reply_text(f"❌ No job named {args[0]}")
+        target = rec.get("target_group") or "All Groups"
+        detail = [
+            job_line(name, rec),
+            f"• Target: `{target}`",
+            f"• Source: `{rec.get('from_chat_id')}` / `{rec.get('message_id')}`",
+            f"• Last run: `{rec.get('last_run') or '-'}`",
+        ]
+        return await update.message.reply_text("\n".join(detail), parse_mode="Markdown")
 
+    ist = get_ist_now()
+    jobs = config["jobs"]
     lines = []
     lines.append("📊 **BOT STATUS** (All times IST)")
     lines.append("━━━━━━━━━━━━━━━━━━━━━━━")
     lines.append(f"🕒 Current Time: {ist.strftime('%Y-%m-%d %H:%M:%S IST')}")
     lines.append(f"🌙 Night Mode: {config['night_start']:02d}:00 → {config['night_end']:02d}:00")
+    release_at = DEFERRED.next_release()
+    if release_at is not None:
+        release_ist = get_ist_now() + timedelta(seconds=max(0.0, release_at - time.time()))
+        lines.append(f"🌅 Deferred: {len(DEFERRED)} sends held, next release {release_ist.strftime('%H:%M')} IST")
+    if QUIET_HOURS:
+        lines.append(f"🔕 Own quiet hours: {len(QUIET_HOURS)} groups (`/quiet`)")
     lines.append(f"🔴 Global Status: {'ACTIVE' if config.get('is_active', False) else 'INACTIVE'}")
-    lines.append("")
-    lines.append("**JOB STATUS (1-10):**")
+    lines.append(f"🗓 Jobs: {len(SCHEDULER)} scheduled / {len(jobs)} total")
+    penalties = FLOOD.active_penalties()
+    if penalties or FLOOD.raids:
+        lines.append(f"🌊 Flood: {penalties} users muted, {len(FLOOD.raids)} groups under raid")
+    quarantined = len(BREAKER.quarantined())
+    if quarantined:
+        lines.append(f"🩺 Quarantined: {quarantined} groups (`/status health`)")
+    if CAPS:
+        lacking = " • ".join(
+            f"no {name.split()[0]}: {sum(1 for m in CAPS.values() if not m & cap)}" for cap, _, name in CAP_FIELDS
+        )
+        lines.append(f"🔑 Rights ({len(CAPS)} groups): {lacking}")
 
     # status function ke andar lines append karein
     lines.append("\n🛡️ **ANTI-CHANGE LOCKS:**")
@@ -682,41 +3656,30 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lines.append(f"• Locked Name: `{ld.get('name') or 'Not Set'}`")
     lines.append(f"• Locked DP: `{'Yes' if ld.get('pic_file_id') else 'No'}`")
     lines.append(f"• Specific Overrides: `{len(ld.get('groups', {}))}`")
+    lines.append("")
 
-    # Humne JOB_COUNT ko 10 tak support karne ke liye loop chalaya hai
-    for i in range(1, JOB_COUNT + 1):
-        name = f"job_{i}"
-        jobs = context.application.job_queue.get_jobs_by_name(name)
-        running = len(jobs) > 0
-
-        record = config.get("jobs", {}).get(name, {})
-        time_str = record.get("time") or "?"
-        has_message = bool(record.get("from_chat_id") and record.get("message_id"))
-
-        status_icon = "▶️" if running else "⏸"
-        
-        # --- Logic for Display Time ---
-        if "every" in str(time_str):
-            display_time = f"**{time_str}**"
-        elif time_str != "?":
-            display_time = f"**{format_time_12h(time_str)} IST** daily"
-        else:
-            display_time = "**Not Set**"
-
-        # --- Line for each Job ---
-        lines.append(f"{status_icon} **Job {i}**: {display_time} | Message: {'set' if has_message else 'not set'}")
-
-        # Agar job active hai toh next run time dikhao
-        if running:
-            job = jobs[0]
-            nr = getattr(job, 'next_run_time', getattr(job, 'next_t', None))
-            if nr:
-                # Local IST format mein convert karke dikhane ke liye
-                next_run_ist = nr + timedelta(hours=5, minutes=30)
-                lines.append(f"     ⏭ Next run: `{next_run_ist.strftime('%H:%M:%S')}`")
-        
-        if not has_message and running:
-            lines.append(f"    ⚠️ Warning: Source message is missing!")
+    if args:
+        # /status all [page]: every job by name, one page at a time
+        try:
+            page = max(1, int(args[1])) if len(args) > 1 else 1
+        except ValueError:
+            page = 1
+        names = sorted(jobs)
+        pages = max(1, -(-len(names) // STATUS_PAGE))
+        page = min(page, pages)
+        lines.append(f"**ALL JOBS** (page {page}/{pages}):")
+        for name in names[(page - 1) * STATUS_PAGE:page * STATUS_PAGE]:
+            lines.append(job_line(name, jobs[name]))
+        if page < pages:
+            lines.append(f"\n➡️ `/status all {page + 1}`")
+    else:
+        # Default view: sirf agle runs, heap se seedha (saare jobs scan/sort nahi)
+        lines.append("**NEXT RUNS:**")
+        for _, name in SCHEDULER.upcoming(STATUS_PAGE):
+            lines.append(job_line(name, jobs[name]))
+        if not len(SCHEDULER):
+            lines.append("• No scheduled jobs")
+        lines.append("\n`/status <job>` • `/status all [page]`")
 
     msg = "\n".join(lines)
     await update.message.reply_text(msg, parse_mode='Markdown')
@@ -737,41 +3700,64 @@ async def setgname(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     config["locked_details"]["name"] = base_name
-
-    success = 0
-
-    for index, gid in enumerate(GROUP_IDS, start=1):
-        try:
-            group_name = f"{index:02d}. {base_name}"
-
-            await context.bot.set_chat_title(
-                chat_id=gid,
-                title=group_name
-            )
-
-            success += 1
-            await asyncio.sleep(1)
-
-        except Exception as e:
-            print(f"Name update failed {gid}: {e}")
-
-    await update.message.reply_text(
-        f"✅ Serial numbering updated in {success} groups."
-    )
+    save("locked_details")
+    async def send(gid):
+        title = f"{REGISTRY.serial(gid):02d}. {base_name}"
+        await tg_call(bot_for(gid, context.bot).set_chat_title, chat_id=gid, title=title)
+        chat_state(gid).title = title
+
+    async def work(op):
+        return await fan_out(targets, send, label="setgname", on_result=op.record)
+
+    def finish(results):
+        for gid, res in results.items():
+            if isinstance(res, Exception):
+                log.warning("Name update failed %s: %s", gid, res, extra={"group": gid, "sample": "name_failed"})
+        return f"✅ Serial numbering updated in {count_ok(results)} groups." + failed_note(results)
+
+    targets, skipped = split_capable(REGISTRY.active(), CAN_CHANGE_INFO, via_shards=True)
+    await report_skipped(update, skipped, CAN_CHANGE_INFO)
+    start_operation(update, context, "setgname", len(targets), work, finish)
 async def setgdesc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update): return
     val = " ".join(context.args)
     if not val: return await update.message.reply_text("❌ Usage: `/setgdesc Description`")
     
     config["locked_details"]["desc"] = val
-    success = 0
-    for gid in GROUP_IDS:
-        try:
-            await context.bot.set_chat_description(chat_id=gid, description=val)
-            success += 1
-            await asyncio.sleep(0.5)
-        except: pass
-    await update.message.reply_text(f"✅ Description forced in {success} groups.")
+    save("locked_details")
+
+    async def send(gid):
+        await tg_call(context.bot.set_chat_description, chat_id=gid, description=val)
+        state = chat_state(gid)
+        state.description = val
+        state.desc_checked = time.monotonic()
+
+    async def work(op):
+        return await fan_out(targets, send, label="setgdesc", on_result=op.record)
+
+    targets, skipped = split_capable(REGISTRY.active(), CAN_CHANGE_INFO)
+    await report_skipped(update, skipped, CAN_CHANGE_INFO)
+    start_operation(
+        update, context, "setgdesc", len(targets), work,
+        lambda results: f"✅ Description forced in {count_ok(results)} groups." + failed_note(results),
+    )
+
+
+# Locked DP bytes, downloaded once and reused for /setgpic uploads and photo reverts.
+# set_chat_photo file_id accept nahi karta, isliye bytes hi reusable form hain.
+LOCKED_PHOTO = {"file_id": None, "data": None}
+
+
+async def locked_photo_bytes(bot):
+    """Bytes of the locked DP; downloads at most once per file_id (e.g. after a restart)."""
+    file_id = config.get("locked_details", {}).get("pic_file_id")
+    if not file_id:
+        return None
+    if LOCKED_PHOTO["file_id"] != file_id or LOCKED_PHOTO["data"] is None:
+        tg_file = await bot.get_file(file_id)
+        LOCKED_PHOTO["data"] = bytes(await tg_file.download_as_bytearray())
+        LOCKED_PHOTO["file_id"] = file_id
+    return LOCKED_PHOTO["data"]
 
 
 async def setgpic(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -801,71 +3787,42 @@ async def setgpic(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     try:
-        print(f"📸 PHOTO FILE ID: {photo_file_id}")
+        log.info("📸 PHOTO FILE ID: %s", photo_file_id)
 
         # Save lock
         config["locked_details"]["pic_file_id"] = photo_file_id
-
-        # Download Telegram file
-        tg_file = await context.bot.get_file(photo_file_id)
-
-        success = 0
-        failed = 0
-
-        msg = await update.message.reply_text(
-            f"⏳ Updating DP in {len(GROUP_IDS)} groups..."
-        )
-
-        # Download once to temp file
-        with tempfile.NamedTemporaryFile(
-            suffix=".jpg",
-            delete=False
-        ) as temp_file:
-
-            await tg_file.download_to_drive(
-                custom_path=temp_file.name
+        save("locked_details")
+
+        # Download once into memory (no temp file)
+        photo = await locked_photo_bytes(context.bot)
+        log.info("📂 Photo cached in memory: %d bytes", len(photo))
+
+        async def send(gid):
+            await tg_call(context.bot.set_chat_photo, chat_id=gid, photo=photo)
+            chat_state(gid).photo_dirty = False
+
+        async def work(op):
+            return await fan_out(targets, send, label="setgpic", on_result=op.record)
+
+        def finish(results):
+            success = count_ok(results)
+            for gid, res in results.items():
+                if isinstance(res, Exception):
+                    log.warning("❌ DP Failed %s: %s", gid, res, extra={"group": gid, "sample": "dp_failed"})
+            return (
+                f"✅ DP Update Complete\n\n"
+                f"Success: {success}\n"
+                f"Failed: {len(results) - success}"
             )
 
-            temp_path = temp_file.name
-
-        print(f"📂 Temp File: {temp_path}")
-
-        # Update all groups
-        for gid in GROUP_IDS:
-
-            try:
-                with open(temp_path, "rb") as photo:
-
-                    await context.bot.set_chat_photo(
-                        chat_id=gid,
-                        photo=photo
-                    )
-
-                success += 1
-
-                print(
-                    f"✅ DP Updated: {gid}"
-                )
-
-            except Exception as e:
-
-                failed += 1
-
-                print(
-                    f"❌ DP Failed {gid}: {e}"
-                )
-
-            await asyncio.sleep(2)
-
-        await msg.edit_text(
-            f"✅ DP Update Complete\n\n"
-            f"Success: {success}\n"
-            f"Failed: {failed}"
-        )
+        # Update all groups (progress message is edited while it runs)
+        targets, skipped = split_capable(REGISTRY.active(), CAN_CHANGE_INFO)
+        await report_skipped(update, skipped, CAN_CHANGE_INFO)
+        start_operation(update, context, "setgpic", len(targets), work, finish)
 
     except Exception as e:
 
-        print(f"❌ Fatal Error: {e}")
+        log.exception("❌ Fatal Error: %s", e)
 
         await update.message.reply_text(
             f"❌ Error:\n{e}"
@@ -879,20 +3836,19 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message.reply_to_message:
         return await update.message.reply_text("❌ Reply to a message.")
 
-    sent = 0
-    for gid in GROUP_IDS:
-        try:
-            await context.bot.copy_message(
-                gid,
-                update.message.reply_to_message.chat_id,
-                update.message.reply_to_message.message_id
-            )
-            sent += 1
-            await asyncio.sleep(0.5)
-        except Exception:
-            pass
+    src = update.message.reply_to_message
+    targets = REGISTRY.active()
 
-    await update.message.reply_text(f"✅ Sent to {sent} groups.")
+    async def work(op):
+        return await dispatch(
+            context.bot, "copy", targets, "broadcast", op=op, notify_chat=update.effective_chat.id,
+            from_chat_id=src.chat_id, message_id=src.message_id,
+        )
+
+    start_operation(
+        update, context, "broadcast", len(targets), work,
+        lambda results: f"✅ Sent to {count_ok(results)} groups." + failed_note(results),
+    )
 
 
 async def pin(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -901,105 +3857,546 @@ async def pin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message.reply_to_message:
         return await update.message.reply_text("❌ Reply to a message.")
 
-    success = 0
-    for gid in GROUP_IDS:
-        try:
-            msg = await context.bot.copy_message(
-                gid,
-                update.message.reply_to_message.chat_id,
-                update.message.reply_to_message.message_id
-            )
-            await context.bot.pin_chat_message(gid, msg.message_id)
-            success += 1
-            await asyncio.sleep(0.5)
-        except Exception:
-            pass
+    src = update.message.reply_to_message
+    targets, skipped = split_capable(REGISTRY.active(), CAN_PIN, via_shards=True)
+    await report_skipped(update, skipped, CAN_PIN)
+
+    async def work(op):
+        return await dispatch(
+            context.bot, "copy_pin", targets, "pin", op=op, notify_chat=update.effective_chat.id,
+            from_chat_id=src.chat_id, message_id=src.message_id,
+        )
 
-    await update.message.reply_text(f"📌 Pinned in {success} groups.")
+    start_operation(
+        update, context, "pin", len(targets), work,
+        lambda results: f"📌 Pinned in {count_ok(results)} groups." + failed_note(results),
+    )
 
 
 async def unpinall(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Unpin our last /pin everywhere (ledger); `/unpinall force` clears every pin."""
+    if not is_admin(update):
+        return
+    force = bool(context.args) and context.args[0].lower() == "force"
+
+    async def send(gid):
+        bot = bot_for(gid, context.bot)
+        if force:
+            return await tg_call(bot.unpin_all_chat_messages, chat_id=gid)
+        await tg_call(bot.unpin_chat_message, chat_id=gid, message_id=LEDGER.pins[gid])
+        LEDGER.unpinned(gid)
+        return True
+
+    async def work(op):
+        return await fan_out(targets, send, label="unpinall", on_result=op.record)
+
+    active, no_rights = split_capable(REGISTRY.active(), CAN_PIN, via_shards=True)
+    await report_skipped(update, no_rights, CAN_PIN)
+    targets = active if force else [gid for gid in active if gid in LEDGER.pins]
+    skipped = len(active) - len(targets)
+    if not targets:
+        return await update.message.reply_text("ℹ️ No pin of ours on record. Use `/unpinall force` to clear every pin.", parse_mode="Markdown")
+    start_operation(
+        update, context, "unpinall", len(targets), work,
+        lambda results: f"🧹 Unpinned in {count_ok(results)} groups."
+        + (f"\nℹ️ {skipped} groups have no pin of ours on record (use `/unpinall force`)." if skipped else "")
+        + failed_note(results),
+    )
+
+
+async def recall(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/recall <run id|label> ... — delete what those runs sent, in every group."""
     if not is_admin(update):
         return
+    if not context.args:
+        recent = list(LEDGER.runs.values())[-10:][::-1]
+        if not recent:
+            return await update.message.reply_text("📒 Ledger is empty — nothing to recall.")
+        lines = [entry.describe() for entry in recent]
+        return await update.message.reply_text(
+            "📒 Recent runs (`/recall <id|label>`):\n" + "\n".join(lines), parse_mode="Markdown"
+        )
+
+    entries = []
+    for key in context.args:
+        entry = LEDGER.find(key)
+        if entry is None:
+            return await update.message.reply_text(f"❌ No run `{key}` in the ledger.", parse_mode="Markdown")
+        entries.append(entry)
+
+    by_chat = {}  # gid -> message ids to delete, across all the runs asked for
+    for entry in entries:
+        for gid, message_id in zip(entry.chats, entry.messages):
+            by_chat.setdefault(gid, []).append(message_id)
+
+    async def send(gid):
+        bot = bot_for(gid, context.bot)
+        ids = by_chat[gid]
+        for i in range(0, len(ids), RECALL_BATCH):
+            await tg_call(bot.delete_messages, chat_id=gid, message_ids=ids[i:i + RECALL_BATCH])
+        return len(ids)
 
-    done = 0
-    for gid in GROUP_IDS:
+    async def work(op):
+        return await fan_out(list(by_chat), send, label="recall", on_result=op.record)
+
+    def finish(results):
+        done = [gid for gid, res in results.items() if not isinstance(res, Exception)]
+        for entry in entries:
+            LEDGER.recalled(entry, done)
+        deleted = sum(results[gid] for gid in done)
+        return f"🗑 Recalled {deleted} messages from {len(done)} groups." + failed_note(results)
+
+    label = "recall " + " ".join(entry.run_id for entry in entries)
+    start_operation(update, context, label, len(by_chat), work, finish)
+
+
+# ================= GROUP DIRECTORY CACHE =================
+# /info aur /stats yahin se turant padhte hain; refresh background mein hota hai.
+# Ek saath poora refresh nahi: har META_CYCLE sirf sabse purane groups, utne hi jitne
+# rate budget ka META_SHARE hissa allow kare (har group = 2 calls). 10k groups par
+# effective TTL apne aap lamba ho jata hai (~len(REGISTRY) / cap * META_CYCLE) — sends
+# ka budget nahi khata.
+
+META_TTL = int(os.getenv("META_TTL", "900"))  # seconds before cached metadata is refreshed
+META_CYCLE = 10                                    # chat_meta_job interval (one slice per run)
+META_SHARE = float(os.getenv("META_SHARE", "0.1"))  # share of GLOBAL_RATE the background refresh may use
+
+
+class ChatMeta:
+    __slots__ = ("title", "members", "invite_link", "fetched", "tried", "error")
+
+    def __init__(self):
+        self.title = None
+        self.members = None
+        self.invite_link = None  # cached forever — export_chat_invite_link revokes the old one
+        self.fetched = 0.0       # monotonic time of the last successful refresh
+        self.tried = 0.0         # ... of the last attempt — failing groups don't hog every slice
+        self.error = None
+
+
+CHAT_META = {}
+META_REFRESH = None  # the running refresh task, so concurrent callers share it
+
+
+async def fetch_chat_meta(bot, gid):
+    meta = CHAT_META.get(gid)
+    if meta is None:
+        meta = CHAT_META[gid] = ChatMeta()
+    meta.tried = time.monotonic()
+    try:
+        chat = await tg_call(bot.get_chat, dead_letter=False, chat_id=gid)
+        members = await tg_call(bot.get_chat_member_count, dead_letter=False, chat_id=gid)
+    except Exception as e:
+        meta.error = f"{type(e).__name__}: {e}"
+        raise
+
+    link = chat.invite_link or meta.invite_link
+    if not link and can(gid, CAN_INVITE):
+        # Link banane ke liye bot admin hona chahiye; sirf ek baar try karte hain
         try:
-            await context.bot.unpin_all_chat_messages(gid)
-            done += 1
-            await asyncio.sleep(0.3)
+            link = await tg_call(bot.export_chat_invite_link, dead_letter=False, chat_id=gid)
         except Exception:
-            pass
-
-    await update.message.reply_text(f"🧹 Unpinned in {done} groups.")
+            link = None
+
+    meta.title = chat.title
+    meta.members = members
+    meta.invite_link = link
+    meta.fetched = time.monotonic()
+    meta.error = None
+
+    # get_chat ne description bhi di hai — monitor_changes ka cache bhi fresh kar do
+    state = chat_state(gid)
+    state.title = chat.title
+    state.description = chat.description or ""
+    state.desc_checked = meta.fetched
+    return meta
+
+
+def refresh_chat_meta(bot, group_ids=None) -> asyncio.Task:
+    """Start (or join) a concurrent refresh of `group_ids` (default: every group)."""
+    global META_REFRESH
+    if META_REFRESH is None or META_REFRESH.done():
+        group_ids = REGISTRY.active() if group_ids is None else group_ids
+        META_REFRESH = asyncio.create_task(fan_out(group_ids, lambda gid: fetch_chat_meta(bot, gid), label="chat_meta"))
+    return META_REFRESH
+
+
+def stale_groups() -> list:
+    """Active groups not tried for META_TTL, least recently tried first."""
+    now = time.monotonic()
+    tried = {gid: CHAT_META[gid].tried if gid in CHAT_META else 0.0 for gid in REGISTRY.active()}
+    return sorted((gid for gid, at in tried.items() if now - at > META_TTL), key=tried.get)
+
+
+async def chat_meta_job(context: ContextTypes.DEFAULT_TYPE):
+    """Repeating JobQueue job keeping CHAT_META warm, one capped slice per run."""
+    cap = max(1, int(GLOBAL_RATE * META_SHARE * META_CYCLE / 2))
+    due = stale_groups()
+    if not due:
+        return
+    results = await refresh_chat_meta(context.bot, due[:cap])
+    log.debug("📂 Chat metadata refreshed: %d/%d groups, %d still due", count_ok(results), len(results),
+              max(0, len(due) - cap))
 
 
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
 
-    status_msg = await update.message.reply_text("🔄 Groups ki jaankari fetch ho rahi hai, please wait...")
-    
-    text = "📂 **Hanuman - GROUP DIRECTORY**\n"
-    text += "━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-    
+    if not any(meta.fetched for meta in CHAT_META.values()):
+        # Pehli baar: cache khaali hai, ek refresh ka wait karna padega
+        status_msg = await update.message.reply_text("🔄 Groups ki jaankari fetch ho rahi hai, please wait...")
+        await refresh_chat_meta(context.bot)
+        await status_msg.delete()
+    # Warna cached data dikhao — chat_meta_job use slice by slice fresh rakhta hai
+
+    header = "📂 **Hanuman - GROUP DIRECTORY**\n"
+    header += "━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+
+    chunks = []
+    text = header
     success_count = 0
-    for index, gid in enumerate(GROUP_IDS, start=1):
-        try:
-            chat = await context.bot.get_chat(gid)
-            members = await context.bot.get_chat_member_count(gid)
-            
-            # Link fetch karne ki koshish (Bot admin hona chahiye)
-            link = chat.invite_link
-            if not link:
-                try:
-                    link = await context.bot.export_chat_invite_link(gid)
-                except Exception:
-                    link = "Link Unavailable"
-
-            # Professional formatting
-            text += f"{index:02d}. **{chat.title}**\n"
-            text += f"   👥 Members: `{members}`\n"
-            text += f"   🔗 [Join Group]({link})\n\n"
+    for index, gid in enumerate(REGISTRY.active(), start=1):
+        meta = CHAT_META.get(gid)
+        if meta and meta.fetched:
+            entry = f"{index:02d}. **{meta.title}**\n"
+            entry += f"   👥 Members: `{meta.members}`\n"
+            entry += f"   🔗 [Join Group]({meta.invite_link or 'Link Unavailable'})\n\n"
             success_count += 1
-            
-            # Anti-flood delay
-            await asyncio.sleep(0.2)
-        except Exception as e:
-            text += f"{index:02d}. ❌ ID: `{gid}`\n   Status: Access Denied/Not Admin\n\n"
+        else:
+            entry = f"{index:02d}. ❌ ID: `{gid}`\n   Status: Access Denied/Not Admin\n\n"
 
+        # Telegram message limit 4096 chars — lambi list ko tod do
+        if len(text) + len(entry) > 3800:
+            chunks.append(text)
+            text = ""
+        text += entry
+
+    oldest = min((meta.fetched for meta in CHAT_META.values() if meta.fetched), default=time.monotonic())
+    updated_at = get_ist_now() - timedelta(seconds=time.monotonic() - oldest)
     text += "━━━━━━━━━━━━━━━━━━━━━━━\n"
-    text += f"✅ **Total Active Groups:** {success_count}/{len(GROUP_IDS)}\n"
-    text += f"🕒 **Last Updated:** {get_ist_now().strftime('%H:%M:%S')} IST"
+    text += f"✅ **Total Active Groups:** {success_count}/{len(REGISTRY)}\n"
+    text += f"🕒 **Last Updated:** {updated_at.strftime('%H:%M:%S')} IST"
+    chunks.append(text)
 
-    # Purane status message ko delete karke final report bhejna
-    await status_msg.delete()
-    await update.message.reply_text(text, parse_mode="Markdown", disable_web_page_preview=True)
+    for chunk in chunks:
+        await update.message.reply_text(chunk, parse_mode="Markdown", disable_web_page_preview=True)
 
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_admin(update):
         return
-    await update.message.reply_text(f"📊 Total groups: {len(GROUP_IDS)}")
+    reachable = [CHAT_META[gid] for gid in REGISTRY.active() if gid in CHAT_META and CHAT_META[gid].fetched]
+    members = sum(meta.members or 0 for meta in reachable)
+    await update.message.reply_text(
+        f"📊 Total groups: {len(REGISTRY)}\n"
+        f"✅ Reachable: {len(reachable)}\n"
+        f"👥 Total members: {members}"
+    )
+
+# ================= GROUP REGISTRY =================
+
+async def track_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """my_chat_member: bot added to / removed from a group."""
+    change = update.my_chat_member
+    chat = change.chat
+    if chat.type not in (Chat.GROUP, Chat.SUPERGROUP):
+        return
+
+    status = change.new_chat_member.status
+    if status in (ChatMember.LEFT, ChatMember.BANNED):
+        CAPS.pop(chat.id, None)
+        if REGISTRY.set_status(chat.id, "left"):
+            log.info("👋 Removed from group %s (%s)", chat.id, chat.title, extra={"group": chat.id})
+        return
+
+    CAPS[chat.id] = caps_from_member(change.new_chat_member)  # added / promoted / demoted
+    if chat.id not in REGISTRY:
+        # Koi bhi bot ko add kar sakta hai — sirf admin ka add kiya group seedha active hota hai
+        by_admin = change.from_user is not None and change.from_user.id in ACL.privileged
+        REGISTRY.set_status(chat.id, "active" if by_admin else "pending")
+        log.info("➕ Added to group %s (%s) → %s", chat.id, chat.title, REGISTRY.status(chat.id), extra={"group": chat.id})
+
+
+async def track_migration(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Group upgraded to supergroup: remap the old ID."""
+    message = update.message
+    if message.migrate_to_chat_id:
+        remap_group(message.chat.id, message.migrate_to_chat_id)
+    elif message.migrate_from_chat_id:
+        remap_group(message.migrate_from_chat_id, message.chat.id)
+
+
+async def groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    pending = REGISTRY.with_status("pending")
+    left = REGISTRY.with_status("left")
+    lines = [
+        f"🗂 Active groups: {len(REGISTRY)}",
+        f"⏳ Pending approval: {len(pending)}",
+        f"👋 Left/kicked: {len(left)}",
+    ]
+    if pending:
+        lines.append("\nPending (approve with /addgroup <id>):")
+        lines.extend(f"• `{gid}`" for gid in pending[:30])
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+
+async def addgroup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Group ko active list mein daalo (Usage: /addgroup -100123)"""
+    if not is_admin(update):
+        return
+    try:
+        gid = int(context.args[0])
+    except (IndexError, ValueError):
+        return await update.message.reply_text("❌ Usage: `/addgroup <group_id>`", parse_mode="Markdown")
+    if REGISTRY.set_status(gid, "active"):
+        await update.message.reply_text(f"✅ Group `{gid}` added. Total: {len(REGISTRY)}", parse_mode="Markdown")
+    else:
+        await update.message.reply_text("ℹ️ Ye group pehle se active hai.")
+
+
+async def delgroup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Group ko fan-outs se hatao (Usage: /delgroup -100123)"""
+    if not is_admin(update):
+        return
+    try:
+        gid = int(context.args[0])
+    except (IndexError, ValueError):
+        return await update.message.reply_text("❌ Usage: `/delgroup <group_id>`", parse_mode="Markdown")
+    if gid in REGISTRY:
+        REGISTRY.set_status(gid, "left")
+        await update.message.reply_text(f"🗑️ Group `{gid}` removed. Total: {len(REGISTRY)}", parse_mode="Markdown")
+    else:
+        await update.message.reply_text("❌ Ye group active list mein nahi hai.")
+
+async def shards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Per-token group counts (Usage: /shards, /shards probe to re-check admin rights)"""
+    if not is_admin(update):
+        return
+    if len(BOTS) < 2:
+        return await update.message.reply_text("ℹ️ Sirf ek token hai — EXTRA_TOKENS set karein.")
+    if context.args and context.args[0] == "probe":
+        await update.message.reply_text("🔄 Helper bots ke admin rights check ho rahe hain...")
+        await probe_shards(context.bot)
+
+    counts = {}
+    for gid in REGISTRY.active():
+        bot = bot_for(gid, context.bot)
+        counts[bot.id] = counts.get(bot.id, 0) + 1
+    lines = ["🤝 **SHARDS**"]
+    for bot_id, bot in BOTS.items():
+        tag = " (primary)" if bot is context.bot else ""
+        lines.append(f"• @{bot.username}{tag}: {counts.get(bot_id, 0)} groups")
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+# ================= BULK OPERATIONS =================
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop a running bulk operation (Usage: /cancel <id>; without id lists them)"""
+    if not is_admin(update):
+        return
+    if not context.args:
+        if not OPERATIONS:
+            return await update.message.reply_text("✅ Nothing running.")
+        lines = ["⏳ Running operations:"] + [op.render() for op in OPERATIONS.values()]
+        return await update.message.reply_text("\n\n".join(lines))
+    try:
+        op = OPERATIONS[int(context.args[0].lstrip("#"))]
+    except (ValueError, KeyError):
+        return await update.message.reply_text(f"❌ No running operation {context.args[0]}")
+    op.task.cancel()
+    await update.message.reply_text(f"🛑 Cancelling #{op.id} {op.label} ({op.sent} sent so far)...")
+
+# ================= DEAD LETTERS =================
+
+async def deadletters(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List sends that failed permanently (latest 20)."""
+    if not is_admin(update):
+        return
+    if not DEAD_LETTERS:
+        return await update.message.reply_text("✅ Dead-letter list is empty.")
+
+    lines = [f"☠️ Dead letters: {len(DEAD_LETTERS)}"]
+    start = max(0, len(DEAD_LETTERS) - 20)
+    for i in range(start, len(DEAD_LETTERS)):
+        item = DEAD_LETTERS[i]
+        lines.append(f"{i + 1}. [{item['at']}] {item['method']} → {item['kwargs'].get('chat_id')}\n   {item['error']}")
+    lines.append("\n/replay all  •  /replay <no>  •  /cleardead")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def replay(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Re-send dead letters (Usage: /replay all | /replay 3)"""
+    if not is_admin(update):
+        return
+    try:
+        arg = context.args[0]
+        if arg == "all":
+            items = list(DEAD_LETTERS)
+            DEAD_LETTERS.clear()
+        else:
+            index = int(arg) - 1
+            if not 0 <= index < len(DEAD_LETTERS):
+                raise ValueError
+            items = [DEAD_LETTERS[index]]
+            del DEAD_LETTERS[index]
+    except (IndexError, ValueError):
+        return await update.message.reply_text("❌ Usage: `/replay all` or `/replay <no>`", parse_mode="Markdown")
+
+    async def send(i):
+        item = items[i]
+        return await tg_call(getattr(item["bot"], item["method"]), **item["kwargs"])
+
+    async def work(op):
+        # Keys are list positions (one chat can have several dead letters), not chat IDs
+        return await fan_out(range(len(items)), send, label="replay", on_result=op.record, breaker=False)
+
+    # Jo phir fail hoga wo wapas DEAD_LETTERS mein chala jayega
+    start_operation(
+        update, context, "replay", len(items), work,
+        lambda results: f"🔁 Replayed {count_ok(results)}/{len(items)}." + failed_note(results),
+    )
+
+
+async def cleardead(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+    count = len(DEAD_LETTERS)
+    DEAD_LETTERS.clear()
+    await update.message.reply_text(f"🧹 Cleared {count} dead letters.")
 
 # =====================================================
 # 🚀 MAIN
 # =====================================================
 
+def start_send_workers(stop) -> list:
+    global GLOBAL_RATE, OUTBOX
+    GLOBAL_RATE /= SEND_WORKERS + 1  # same split as in drain_outbox()
+    OUTBOX = Outbox(DB_PATH, SEND_WORKERS)
+    finished = OUTBOX.recover()
+    for batch, gid in finished:
+        if batch in RUNS:
+            RUNS[batch].mark(gid)  # sent before the restart, just never collected
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for lane in range(SEND_WORKERS):
+        worker = ctx.Process(target=send_worker, args=(lane, SEND_WORKERS, stop), name=f"send-worker-{lane}", daemon=True)
+        worker.start()
+        workers.append(worker)
+    log.info("📬 %d send worker(s) started (%d finished sends folded into checkpoints)", SEND_WORKERS, len(finished))
+    return workers
+
+
+async def watch_send_workers(workers: list, stop):
+    """Restart a worker process that died; its lane's 'sending' rows are requeued first."""
+    while not stop.is_set():
+        await asyncio.sleep(5)
+        for lane, worker in enumerate(workers):
+            if worker.is_alive() or stop.is_set():
+                continue
+            log.warning("⚠️ Send worker %d exited (%s), restarting", lane + 1, worker.exitcode)
+            await asyncio.to_thread(OUTBOX.recover_lane, lane)
+            workers[lane] = worker = multiprocessing.get_context("spawn").Process(
+                target=send_worker, args=(lane, SEND_WORKERS, stop), name=f"send-worker-{lane}", daemon=True
+            )
+            worker.start()
+
+
+async def serve(telegram_app: Application, helper_bots=()):
+    """Run the bot and the web server together on one event loop until SIGINT/SIGTERM."""
+    server = make_web_app(telegram_app).listen(PORT, address="0.0.0.0")
+    log.info("🌐 Web server listening on :%d (mode: %s)", PORT, RUN_MODE)
+
+    workers = []
+    stop_workers = multiprocessing.get_context("spawn").Event()
+    if SEND_WORKERS > 0:
+        workers = start_send_workers(stop_workers)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    async with telegram_app:
+        BOTS[telegram_app.bot.id] = telegram_app.bot
+        for helper in helper_bots:
+            await helper.initialize()
+            BOTS[helper.id] = helper
+        # Plain task (cancelled on stop); until it is done nothing gets skipped
+        probes = asyncio.create_task(startup_probes(telegram_app.bot))
+
+        await restore_jobs(telegram_app)
+        if RUN_MODE == "webhook":
+            await telegram_app.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+        else:
+            await telegram_app.updater.start_polling(
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+        await telegram_app.start()
+        # Plain asyncio task: Application.stop() waits for its own tasks, and this one never ends
+        watchdog = asyncio.create_task(watch_send_workers(workers, stop_workers)) if workers else None
+        log.info("✅ Bot is running with %d groups...", len(REGISTRY))
+
+        await stop.wait()
+        probes.cancel()
+        if watchdog:
+            watchdog.cancel()
+        await suspend_operations()  # checkpoints stay; runs resume on the next start
+
+        if telegram_app.updater and telegram_app.updater.running:
+            await telegram_app.updater.stop()
+        await telegram_app.stop()
+        server.stop()
+    for helper in helper_bots:
+        await helper.shutdown()
+    stop_workers.set()
+    for worker in workers:
+        await asyncio.to_thread(worker.join, 10)
+        if worker.is_alive():
+            worker.terminate()
+    await close_store(telegram_app)
+
+
 def main():
-    # 1. Web server start (Render ke liye)
-    start_web() 
-    print("🌐 Web server started for Render Health Check")
+    setup_logging()
+    log.info("Bot file loaded successfully")
+
+    # 1. Saved config + jobs (SQLite) — jobs are re-scheduled in restore_jobs()
+    open_store()
+
+    # 2. Application Build with Network Resilience (+ per-method API metrics)
+    t_request = InstrumentedRequest(connection_pool_size=20, read_timeout=60, write_timeout=60)
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .request(t_request)
+    )
+    if RUN_MODE == "webhook":
+        builder = builder.updater(None)  # updates aate hain WebhookHandler se
+    telegram_app = builder.build()
 
-    # 2. Application Build with Network Resilience
-    from telegram.request import HTTPXRequest
-    t_request = HTTPXRequest(connection_pool_size=20, read_timeout=60, write_timeout=60)
-    telegram_app = Application.builder().token(TOKEN).request(t_request).build()
+    # GROUP -2: Group registry (bot added/removed, group → supergroup migration)
+    telegram_app.add_handler(ChatMemberHandler(track_membership, ChatMemberHandler.MY_CHAT_MEMBER), group=-2)
+    telegram_app.add_handler(MessageHandler(filters.StatusUpdate.MIGRATE, track_migration), group=-2)
 
    # GROUP -1: Security (Title, Photo, Video Chat)
     # Isme hum StatusUpdate ke saare events ko catch karenge
+    # UNPRIVILEGED: admins/whitelisted users ke events dispatcher hi drop kar deta hai
     telegram_app.add_handler(MessageHandler(
-        filters.StatusUpdate.ALL, 
+        filters.StatusUpdate.ALL & UNPRIVILEGED,
         monitor_changes
     ), group=-1)
 
@@ -1008,12 +4405,14 @@ def main():
     telegram_app.add_handler(CommandHandler("remove", remove_user))
     telegram_app.add_handler(CommandHandler("block", block_user))
     telegram_app.add_handler(CommandHandler("unblock", unblock_user))
+    telegram_app.add_handler(CommandHandler("filter", content_filter))
 
     # B. CORE ADMIN COMMANDS
     telegram_app.add_handler(CommandHandler("start", start))
     telegram_app.add_handler(CommandHandler("help", help_command))
     telegram_app.add_handler(CommandHandler("status", status))
     telegram_app.add_handler(CommandHandler("settings", settings))
+    telegram_app.add_handler(CommandHandler("quiet", quiet))
 
     # C. GROUP LOCK COMMANDS (Force Update Logic)
     telegram_app.add_handler(CommandHandler("setgname", setgname))
@@ -1025,26 +4424,48 @@ def main():
     # D. BROADCAST & POOL SYSTEM
     telegram_app.add_handler(CommandHandler("setjob", setjob))
     telegram_app.add_handler(CommandHandler("stopjob", stopjob))
+    telegram_app.add_handler(CommandHandler("deljob", deljob))
     telegram_app.add_handler(CommandHandler("autoon", autoon))
     telegram_app.add_handler(CommandHandler("autooff", autooff))
     telegram_app.add_handler(CommandHandler("stopall", stopall))
     telegram_app.add_handler(CommandHandler("broadcast", broadcast))
     telegram_app.add_handler(CommandHandler("pin", pin))
     telegram_app.add_handler(CommandHandler("unpinall", unpinall))
+    telegram_app.add_handler(CommandHandler("recall", recall))
     telegram_app.add_handler(CommandHandler("info", info))
     telegram_app.add_handler(CommandHandler("stats", stats))
+    telegram_app.add_handler(CommandHandler("groups", groups))
+    telegram_app.add_handler(CommandHandler("addgroup", addgroup))
+    telegram_app.add_handler(CommandHandler("delgroup", delgroup))
+    telegram_app.add_handler(CommandHandler("shards", shards))
     telegram_app.add_handler(CommandHandler("clearpool", clearpool))
     telegram_app.add_handler(CommandHandler("resetallpools", resetallpools))
+    telegram_app.add_handler(CommandHandler("deadletters", deadletters))
+    telegram_app.add_handler(CommandHandler("replay", replay))
+    telegram_app.add_handler(CommandHandler("cleardead", cleardead))
+    telegram_app.add_handler(CommandHandler("cancel", cancel))
     
     # F. AUTO-DELETE HANDLER (Sabse Niche)
     # StatusUpdate.ALL ko exclude karna zaroori hai taaki Monitor trigger ho sake
+    # FLOODING (har naya message count hota hai) / BLACKLISTED / CONTENT_SPAM pehle check hote hain — baaki messages ke liye koi coroutine nahi banta
     telegram_app.add_handler(MessageHandler(
-        filters.ALL & ~filters.COMMAND, 
+        ~filters.COMMAND & (FLOODING | BLACKLISTED | CONTENT_SPAM),
         delete_spammer_message
     ), group=1)
 
-    print(f"✅ Bot is running with {len(GROUP_IDS)} groups...")
-    telegram_app.run_polling(drop_pending_updates=True)
+    # Har handler ka execution time /metrics par
+    for handlers in telegram_app.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+
+    # Extra tokens: sirf sending ke liye helper bots (polling/webhook sirf primary par)
+    helper_bots = [make_bot(token) for token in EXTRA_TOKENS]
+
+    # 3. Web server + bot, dono ek hi event loop par
+    try:
+        asyncio.run(serve(telegram_app, helper_bots))
+    finally:
+        stop_logging()
 
 
 # 🔥🔥🔥 YAHAN LIKHNA HAI — FILE KE BILKUL END ME 🔥🔥🔥
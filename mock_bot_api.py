@@ -0,0 +1,310 @@
+"""Local stand-in for the Telegram Bot API, for end-to-end load tests.
+
+Speaks the endpoints broadcast_bot.py uses, enforces Telegram-like flood
+limits (429 + retry_after) and adds configurable latency, so the real bot
+process — HTTPXRequest connection pool, timeouts, retries — can be
+exercised without touching Telegram.
+
+    python mock_bot_api.py --port 8081 --latency 0.05
+    TOKEN=123:test TELEGRAM_API_URL=http://127.0.0.1:8081 ADMIN_IDS=1 python broadcast_bot.py
+
+Control endpoints:
+    POST /mock/updates   body = one Update (JSON); delivered via getUpdates or the webhook
+    POST /mock/command   {"text": "/broadcast", "reply_to": 42} — admin command shortcut
+    GET  /mock/stats     per-method counts, 429s, peak in-flight requests
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict, deque
+
+import httpx
+import tornado.web
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "MockBot", "username": "mock_bot"}
+ADMIN_USER = {"id": 1, "is_bot": False, "first_name": "Admin"}
+
+# Tiny valid JPEG header + padding; good enough for getFile downloads
+FAKE_PHOTO = bytes.fromhex("ffd8ffe000104a46494600010100000100010000ffd9") + b"\0" * 2048
+
+
+class FloodControl:
+    """Sliding-window counters approximating Telegram's limits."""
+
+    def __init__(self, global_per_sec, group_per_min, private_per_sec):
+        self.limits = {
+            "global": (global_per_sec, 1.0),
+            "group": (group_per_min, 60.0),
+            "private": (private_per_sec, 1.0),
+        }
+        self.windows = defaultdict(deque)
+
+    def _hit(self, key, kind, now):
+        limit, period = self.limits[kind]
+        window = self.windows[key]
+        while window and now - window[0] >= period:
+            window.popleft()
+        if len(window) >= limit:
+            return max(1, int(period - (now - window[0]) + 0.999))
+        window.append(now)
+        return 0
+
+    def check(self, token, chat_id):
+        """Return retry_after seconds, or 0 if the call is allowed."""
+        now = time.monotonic()
+        wait = self._hit((token, "global"), "global", now)
+        if wait or chat_id is None:
+            return wait
+        kind = "group" if int(chat_id) < 0 else "private"
+        return self._hit((token, chat_id), kind, now)
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.flood = FloodControl(args.global_rate, args.group_rate, args.private_rate)
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(10_000)
+        self.new_update = asyncio.Event()
+        self.webhook = None  # (url, secret)
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def push_update(self, update):
+        update["update_id"] = next(self.update_ids)
+        if self.webhook:
+            asyncio.get_running_loop().create_task(self.deliver(update))
+        else:
+            self.updates.append(update)
+            self.new_update.set()
+
+    async def deliver(self, update):
+        url, secret = self.webhook
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with httpx.AsyncClient() as client:
+            await client.post(url, json=update, headers=headers)
+
+
+def chat_json(chat_id, title=None):
+    chat_id = int(chat_id)
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": "User"}
+    return {"id": chat_id, "type": "supergroup", "title": title or f"Mock Group {abs(chat_id) % 100000}"}
+
+
+def message_json(state, chat_id, text=None, from_user=BOT_USER):
+    return {
+        "message_id": next(state.message_ids),
+        "date": int(time.time()),
+        "chat": chat_json(chat_id),
+        "from": from_user,
+        "text": text or "",
+    }
+
+
+def admin_rights():
+    return {
+        "status": "administrator", "user": BOT_USER, "can_be_edited": False, "is_anonymous": False,
+        "can_manage_chat": True, "can_delete_messages": True, "can_manage_video_chats": True,
+        "can_restrict_members": True, "can_promote_members": False, "can_change_info": True,
+        "can_invite_users": True, "can_post_stories": False, "can_edit_stories": False,
+        "can_delete_stories": False, "can_pin_messages": True,
+    }
+
+
+# method name -> handler(state, params) returning the "result" payload.
+# getUpdates / setWebhook / deleteWebhook are handled in ApiHandler itself.
+def _true(state, params):
+    return True
+
+
+UPDATE_METHODS = {"getUpdates", "setWebhook", "deleteWebhook"}
+
+METHODS = {
+    "getMe": lambda s, p: BOT_USER,
+    "getWebhookInfo": lambda s, p: {"url": s.webhook[0] if s.webhook else "", "has_custom_certificate": False, "pending_update_count": len(s.updates)},
+    "setMyCommands": _true,
+    "copyMessage": lambda s, p: {"message_id": next(s.message_ids)},
+    "sendMessage": lambda s, p: message_json(s, p["chat_id"], p.get("text")),
+    "editMessageText": lambda s, p: message_json(s, p["chat_id"], p.get("text")),
+    "pinChatMessage": _true,
+    "unpinChatMessage": _true,
+    "unpinAllChatMessages": _true,
+    "setChatTitle": _true,
+    "setChatDescription": _true,
+    "setChatPhoto": _true,
+    "deleteMessage": _true,
+    "deleteMessages": _true,
+    "restrictChatMember": _true,
+    "getChat": lambda s, p: {
+        **chat_json(p["chat_id"]), "description": "", "accent_color_id": 0, "max_reaction_count": 11,
+        "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False, "unique_gifts": False, "premium_subscription": False, "gifts_from_channels": False},
+    },
+    "getChatMemberCount": lambda s, p: random.randint(50, 5000),
+    "getChatMember": lambda s, p: admin_rights() if int(p["user_id"]) == BOT_USER["id"] else {"status": "member", "user": {"id": int(p["user_id"]), "is_bot": False, "first_name": "U"}},
+    "exportChatInviteLink": lambda s, p: f"https://t.me/+mock{abs(int(p['chat_id']))}",
+    "getFile": lambda s, p: {"file_id": p["file_id"], "file_unique_id": "mockuid", "file_size": len(FAKE_PHOTO), "file_path": "photos/mock.jpg"},
+}
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def params(self):
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(self.request.body or b"{}")
+        params = {}
+        for key, values in self.request.body_arguments.items():
+            value = values[-1].decode()
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        for key, values in self.request.query_arguments.items():
+            params.setdefault(key, values[-1].decode())
+        return params
+
+    def reply(self, result=None, error=None, code=200, retry_after=None):
+        self.set_status(code)
+        if error:
+            body = {"ok": False, "error_code": code, "description": error}
+            if retry_after:
+                body["parameters"] = {"retry_after": retry_after}
+        else:
+            body = {"ok": True, "result": result}
+        self.write(body)
+
+    async def get(self, token, method):
+        await self.post(token, method)
+
+    async def post(self, token, method):
+        state = self.state
+        state.calls[method] += 1
+        state.in_flight += 1
+        state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            if method not in METHODS and method not in UPDATE_METHODS:
+                return self.reply(error="Not Found: method not found", code=404)
+            params = self.params()
+
+            if method == "getUpdates":
+                return self.reply(await self.get_updates(params))
+            if method == "setWebhook":
+                state.webhook = (params["url"], params.get("secret_token")) if params.get("url") else None
+                return self.reply(True)
+            if method == "deleteWebhook":
+                state.webhook = None
+                return self.reply(True)
+
+            retry_after = state.flood.check(token, params.get("chat_id"))
+            if retry_after and method != "getMe":
+                state.throttled[method] += 1
+                return self.reply(error=f"Too Many Requests: retry after {retry_after}", code=429, retry_after=retry_after)
+
+            args = state.args
+            if args.latency:
+                await asyncio.sleep(max(0.0, random.gauss(args.latency, args.latency / 4)))
+            if random.random() < args.error_rate:
+                return self.reply(error="Bad Request: chat not found", code=400)
+            self.reply(METHODS[method](state, params))
+        finally:
+            state.in_flight -= 1
+
+    async def get_updates(self, params):
+        state = self.state
+        offset = int(params.get("offset") or 0)
+        state.updates = [u for u in state.updates if u["update_id"] >= offset]
+        if not state.updates:
+            state.new_update.clear()
+            try:
+                await asyncio.wait_for(state.new_update.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return state.updates[:100]
+
+
+class FileHandler(tornado.web.RequestHandler):
+    def get(self, token, path):
+        self.set_header("Content-Type", "image/jpeg")
+        self.write(FAKE_PHOTO)
+
+
+class UpdateHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def post(self):
+        self.state.push_update(json.loads(self.request.body))
+        self.write({"ok": True})
+
+
+class CommandHandler(tornado.web.RequestHandler):
+    """Shortcut: inject an admin command in a private chat, optionally as a reply."""
+
+    def initialize(self, state):
+        self.state = state
+
+    def post(self):
+        body = json.loads(self.request.body)
+        text = body["text"]
+        message = message_json(self.state, ADMIN_USER["id"], text, from_user=ADMIN_USER)
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        if body.get("reply_to"):
+            message["reply_to_message"] = {
+                **message_json(self.state, ADMIN_USER["id"], "payload", from_user=ADMIN_USER),
+                "message_id": body["reply_to"],
+            }
+        self.state.push_update({"message": message})
+        self.write({"ok": True})
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def get(self):
+        self.write({
+            "calls": dict(self.state.calls),
+            "throttled_429": dict(self.state.throttled),
+            "peak_in_flight": self.state.peak_in_flight,
+        })
+
+
+def make_app(state):
+    kwargs = {"state": state}
+    return tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", ApiHandler, kwargs),
+        (r"/file/bot([^/]+)/(.+)", FileHandler),
+        (r"/mock/updates", UpdateHandler, kwargs),
+        (r"/mock/command", CommandHandler, kwargs),
+        (r"/mock/stats", StatsHandler, kwargs),
+    ])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 400")
+    parser.add_argument("--global-rate", type=int, default=30, help="calls/sec per token")
+    parser.add_argument("--group-rate", type=int, default=20, help="calls/min per group")
+    parser.add_argument("--private-rate", type=int, default=3, help="calls/sec per private chat (short bursts are tolerated)")
+    args = parser.parse_args()
+
+    state = MockState(args)
+    make_app(state).listen(args.port, address="127.0.0.1")
+    print(f"Mock Bot API on http://127.0.0.1:{args.port} (latency {args.latency}s, {args.global_rate}/s global)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())